@@ -0,0 +1,112 @@
+from .SgiImage import read_sgi
+from .TextureIndex import resolve_texture_path
+import numpy as np
+import os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+# Every pixel is fully opaque: the alpha channel can be dropped.
+ALPHA_OPAQUE = 'opaque'
+# Every pixel is either fully opaque or fully transparent.
+ALPHA_BINARY = 'binary'
+# Some pixels are partially transparent.
+ALPHA_BLEND = 'blend'
+
+def analyze_alpha(alpha):
+    """
+    Returns whether an alpha channel is opaque, binary or blended.
+        :alpha: A uint8 or uint16 array of alpha values.
+    """
+    maxval = np.iinfo(alpha.dtype).max
+
+    if alpha.size == 0 or alpha.min() == maxval:
+        return ALPHA_OPAQUE
+
+    if not np.count_nonzero((alpha != 0) & (alpha != maxval)):
+        return ALPHA_BINARY
+
+    return ALPHA_BLEND
+
+def get_gray_channel(pixels):
+    """
+    Returns the channel of an alpha texture that ends up as alpha, just like PNMImage's gray channel:
+    the gray channel of grayscale images, and the blue channel of color images.
+        :pixels: A 3D array of rows, columns and channels, as returned by read_sgi or get_pixels.
+    """
+    return pixels[:, :, 0 if pixels.shape[2] < 3 else 2]
+
+class AlphaAnalyzer(object):
+    """
+    Finds out which JPG+RGB textures have an alpha RGB file without any transparency, straight from their RGB files.
+    Used while rewriting models, before their textures are converted, so that their Texture records can ask for
+    three channels instead of four.
+    """
+
+    def __init__(self):
+        # The analysis of every RGB file, by normalized path, along with the size and modification time it was made for.
+        self.results = {}
+
+    def get_stamp(self, path, archives):
+        if archives is not None and archives.contains(path):
+            # Multifiles don't change while we're running.
+            return None
+
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def read_file(self, path, archives):
+        if archives is not None and archives.contains(path):
+            return archives.read(path)
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get_alpha_type(self, path, archives=None):
+        """
+        Returns whether the alpha of an RGB file is opaque, binary or blended, or None if it can't be read.
+            :path: The path of the RGB file.
+            :archives: An optional MultifileStore, for RGB files inside Multifiles.
+        """
+        if archives is not None and not os.path.exists(path):
+            path = archives.find(path) or path
+
+        key = os.path.normcase(path)
+
+        try:
+            stamp = self.get_stamp(path, archives)
+        except OSError:
+            return None
+
+        result = self.results.get(key)
+
+        if result is not None and result[0] == stamp:
+            return result[1]
+
+        try:
+            alpha_type = analyze_alpha(get_gray_channel(read_sgi(self.read_file(path, archives))))
+        except (OSError, ValueError):
+            alpha_type = None
+
+        self.results[key] = (stamp, alpha_type)
+        return alpha_type
+
+    def get_num_channels(self, transformation, phase_files, model_path, archives=None):
+        """
+        Returns the primary_file_num_channels of a texture that has been transformed to PNG:
+        3 if its alpha RGB file is fully opaque, or 0 to use every channel of the PNG file.
+            :transformation: The old texture paths, as returned by transform_to_png.
+            :phase_files: The phase files folder, which texture paths are relative to.
+            :model_path: The path of the model, used to resolve relative texture paths.
+            :archives: An optional MultifileStore, for RGB files inside Multifiles.
+        """
+        if len(transformation) != 2 or not transformation[1].lower().endswith('.rgb'):
+            return 0
+
+        alpha_path = resolve_texture_path(transformation[1], phase_files, model_path)
+        return 3 if self.get_alpha_type(alpha_path, archives) == ALPHA_OPAQUE else 0
@@ -0,0 +1,307 @@
+from . import Main
+from .Profiler import Profiler
+from .TextureIndex import TextureIndex
+import argparse, contextlib, io, os, time, traceback
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+# Command line options that don't apply to batches: the inputs and the mode are chosen per call,
+# and timings are always part of the results.
+COMMAND_LINE_ONLY = ('filenames', 'convert_pack', 'convert_to_jpg', 'profile', 'watch', 'watch_interval', 'watch_debounce')
+
+# Profiler stages that write or remove files.
+WRITE_STAGES = ('write', 'bam_write', 'dedup')
+REMOVE_STAGES = ('remove',)
+
+def get_default_options():
+    """
+    Returns the default of every command line option that applies to batches.
+    """
+    options = vars(Main.make_parser().parse_args(['-']))
+
+    for name in COMMAND_LINE_ONLY:
+        del options[name]
+
+    return options
+
+class BatchOptions(object):
+    """
+    The options of a batch, named after their command line flags: --convert-images becomes convert_images, and so on.
+    Every option defaults to the default of its command line flag.
+    Output is only printed when verbose is set. Either way, it is kept in the result of every call.
+    """
+
+    def __init__(self, verbose=False, **options):
+        defaults = get_default_options()
+        unknown = set(options) - set(defaults)
+
+        if unknown:
+            raise TypeError(f'Unknown batch options: {", ".join(sorted(unknown))}')
+
+        self.__dict__.update(defaults)
+        self.__dict__.update(options)
+        self.verbose = verbose
+
+    def get_args(self, **mode):
+        """
+        Returns these options as parsed command line arguments, as expected by Main.
+            :mode: The mode flags of the call, such as convert_pack.
+        """
+        args = argparse.Namespace(**self.__dict__)
+        args.filenames = []
+        args.convert_pack = False
+        args.convert_to_jpg = False
+        args.watch = False
+        # Files written and removed are found in the profile records.
+        args.profile = True
+
+        for name, value in mode.items():
+            setattr(args, name, value)
+
+        if args.phase_files:
+            args.phase_files = os.path.abspath(args.phase_files)
+
+        return args
+
+class ModelResult(object):
+    """
+    The outcome of rewriting a single model.
+    """
+
+    def __init__(self, path, target_filename, textures, written):
+        self.path = path
+        self.target_filename = target_filename
+        # The texture transformations of switch_texture_mode: the old texture paths of every texture now using PNG.
+        self.textures = textures
+        # False if the model did not need to be rewritten, was up to date in the build cache, or was only scanned.
+        self.written = written
+
+    def __repr__(self):
+        return f'ModelResult({self.path!r}, {len(self.textures)} textures, written={self.written})'
+
+class BatchResult(object):
+    """
+    The outcome of a single call, such as converting a list of models.
+    """
+
+    def __init__(self):
+        # Rewritten models, in the order they were given.
+        self.models = []
+        # Files written and removed, in the order they were written and removed.
+        self.written = []
+        self.removed = []
+        # Images that could not be converted, and the error that stopped the call, if any.
+        self.errors = []
+        # The time spent on the whole call, and the per-stage totals of the profiler.
+        self.seconds = 0.0
+        self.stages = {}
+        # Everything that would have been printed on the command line.
+        self.output = ''
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return f'BatchResult({len(self.models)} models, {len(self.written)} written, {len(self.removed)} removed, {len(self.errors)} errors, {self.seconds:.3f}s)'
+
+class Batch(object):
+    """
+    Converts models and images from within the same process, for build systems.
+
+    The build cache, file index, Multifiles, image converters and texture index are kept between calls,
+    so calling a warm Batch again is much faster than starting a new process for every model.
+    Textures that have already been converted are skipped by later calls: call forget_files when files change on disk.
+
+        with Batch(BatchOptions(jpg=True, rgb=True, convert_images=True, phase_files='resources')) as batch:
+            result = batch.convert_models(['resources/phase_3/models/gui/dialog_box_gui.bam'])
+    """
+
+    def __init__(self, options=None):
+        self.options = options or BatchOptions()
+        args = self.options.get_args()
+        error = Main.get_phase_files_error(args)
+
+        if error:
+            raise ValueError(error)
+
+        Main.setup_p3bamboo()
+        self.cache = Main.make_cache(args)
+        self.file_index = Main.make_file_index(args)
+        self.profiler = Profiler(True)
+        self.archives = Main.make_archives(args)
+        # The image converter of every folder, and the textures used by every model converted so far.
+        self.converters = {}
+        self.index = TextureIndex()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def convert_models(self, filenames):
+        """
+        Rewrites models, and converts the textures they use if convert_images is set.
+            :filenames: The paths of the models. Accepts * and ** as wildcards, folders and Multifiles.
+        """
+        args = self.options.get_args()
+
+        def run(result):
+            if self.file_index is not None:
+                self.file_index.add_folder(args.phase_files)
+
+            converter = self.converters.get(args.phase_files)
+
+            if converter is None and (args.convert_images or args.dump_index):
+                converter = self.converters[args.phase_files] = Main.make_converter(args, args.phase_files, self.cache, self.file_index, self.profiler, self.archives)
+
+            models = Main.convert_models(args, converter, self.index, Main.find_models(filenames, self.archives, Main.make_file_filter(args)), self.cache, self.profiler, self.archives)
+
+            for path, (target_filename, textures) in models.items():
+                result.models.append(ModelResult(path, target_filename, textures, False))
+
+        result = self.run(run)
+        written = set(os.path.normcase(path) for path in result.written)
+
+        for model in result.models:
+            model.written = os.path.normcase(model.target_filename) in written
+
+        return result
+
+    def convert_pack(self, folder):
+        """
+        Converts every JPG+RGB texture in a content pack to PNG.
+            :folder: The content pack folder or Multifile. RGB files are also searched for in phase_files.
+        """
+        args = self.options.get_args(convert_pack=True)
+        error = Main.get_phase_files_error(args)
+
+        if error:
+            raise ValueError(error)
+
+        folder = os.path.abspath(folder)
+
+        def run(result):
+            self.converters[folder] = Main.convert_pack(args, folder, self.cache, self.file_index, self.profiler, self.archives, self.converters.get(folder))
+
+        return self.run(run)
+
+    def convert_to_jpg(self, folder):
+        """
+        Converts every PNG image in a folder to JPG, plus an RGB file for its alpha channel.
+            :folder: The folder or Multifile of PNG images.
+        """
+        args = self.options.get_args(convert_to_jpg=True)
+        folder = os.path.abspath(folder)
+
+        def run(result):
+            self.converters[folder] = Main.convert_to_jpg(args, folder, self.cache, self.file_index, self.profiler, self.archives, self.converters.get(folder))
+
+        return self.run(run)
+
+    def run(self, function):
+        """
+        Runs a single call, and gathers its result.
+        Errors are added to the result instead of being raised, so that the files written so far are still listed.
+            :function: Does the actual work, given the BatchResult.
+        """
+        result = BatchResult()
+        output = io.StringIO()
+        start = time.perf_counter()
+
+        with contextlib.ExitStack() as stack:
+            if not self.options.verbose:
+                stack.enter_context(contextlib.redirect_stdout(output))
+
+            try:
+                function(result)
+                # Every modified Multifile is written once, after everything has been converted.
+                self.archives.save()
+            except Exception as e:
+                traceback.print_exc(file=output if not self.options.verbose else None)
+                result.errors.append(str(e) or type(e).__name__)
+            finally:
+                self.save()
+
+        # Images that could not be converted come first, since they were reported before any error that stopped the call.
+        image_errors = []
+
+        for converter in self.converters.values():
+            image_errors.extend(converter.pop_errors())
+
+        result.errors = image_errors + result.errors
+
+        result.seconds = time.perf_counter() - start
+        result.output = output.getvalue()
+        self.add_records(result, self.profiler.pop_records())
+        return result
+
+    def add_records(self, result, records):
+        profiler = Profiler(True)
+        profiler.merge(records)
+        result.stages = profiler.summary()['stages']
+
+        for name, filename, _, _, _, _ in records:
+            if name in WRITE_STAGES:
+                result.written.append(filename)
+            elif name in REMOVE_STAGES:
+                result.removed.append(filename)
+
+    def forget_files(self, paths):
+        """
+        Forgets files that have changed on disk, so that the next calls convert them again.
+            :paths: The paths of the changed files.
+        """
+        paths = list(paths)
+
+        if self.file_index is not None:
+            for path in paths:
+                self.file_index.refresh(path)
+
+        for converter in self.converters.values():
+            converter.forget_files(paths)
+
+    def save(self):
+        """
+        Saves the build cache and the file index, if enabled.
+        """
+        if self.cache is not None:
+            self.cache.save()
+
+        if self.file_index is not None:
+            self.file_index.save()
+
+    def close(self):
+        for converter in self.converters.values():
+            converter.shutdown()
+
+        self.archives.close()
+        self.save()
+
+def convert_models(filenames, options=None):
+    """
+    Rewrites models with a new Batch. See Batch.convert_models.
+    """
+    with Batch(options) as batch:
+        return batch.convert_models(filenames)
+
+def convert_pack(folder, options=None):
+    """
+    Converts a content pack with a new Batch. See Batch.convert_pack.
+    """
+    with Batch(options) as batch:
+        return batch.convert_pack(folder)
+
+def convert_to_jpg(folder, options=None):
+    """
+    Converts PNG images to JPG+RGB with a new Batch. See Batch.convert_to_jpg.
+    """
+    with Batch(options) as batch:
+        return batch.convert_to_jpg(folder)
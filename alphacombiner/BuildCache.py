@@ -0,0 +1,162 @@
+import hashlib, json, os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+class BuildCache(object):
+    VERSION = 1
+
+    def __init__(self, filename=None, use_hash=False):
+        self.filename = filename
+        self.use_hash = use_hash
+        self.entries = {}
+        self.updates = {}
+
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        with open(self.filename, 'r') as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                print(f'Build cache {self.filename} is corrupt, starting over...')
+                return
+
+        if data.get('version') == self.VERSION:
+            self.entries = data.get('entries', {})
+
+    def save(self):
+        if not self.filename:
+            return
+
+        # Write to a temporary file first, so that an interrupted run never leaves a broken cache behind.
+        temp_filename = self.filename + '.tmp'
+
+        with open(temp_filename, 'w') as f:
+            json.dump({'version': self.VERSION, 'entries': self.entries}, f)
+
+        os.replace(temp_filename, self.filename)
+
+    def hash_file(self, path):
+        file_hash = hashlib.sha1()
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def get_stamp(self, path):
+        """
+        Returns a dictionary describing the current state of a file.
+            :path: The path of the file.
+        """
+        stat = os.stat(path)
+        stamp = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+        if self.use_hash:
+            stamp['hash'] = self.hash_file(path)
+
+        return stamp
+
+    def get_stamps(self, paths):
+        """
+        Returns the current state of every file that exists on disk, by path.
+        Input files should be stamped before they are read, so that changes made while they are being converted are noticed.
+            :paths: A list of file paths.
+        """
+        return {path: self.get_stamp(path) for path in paths if os.path.isfile(path)}
+
+    def is_stamp_current(self, path, stamp):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        if stat.st_size != stamp['size']:
+            return False
+        if stat.st_mtime_ns == stamp['mtime']:
+            return True
+
+        # The file has been touched, but its contents might still be the same.
+        return self.use_hash and 'hash' in stamp and self.hash_file(path) == stamp['hash']
+
+    def is_up_to_date(self, key, inputs, flags):
+        """
+        Checks whether the outputs of a previous run can be reused.
+            :key: A unique key describing this build step.
+            :inputs: A list of input file paths.
+            :flags: A JSON serializable object describing the conversion options.
+        """
+        entry = self.entries.get(key)
+
+        if not entry or entry['flags'] != flags:
+            return False
+        if sorted(entry['inputs']) != sorted(inputs):
+            return False
+
+        for path, stamp in entry['inputs'].items():
+            if not self.is_stamp_current(path, stamp):
+                return False
+
+        return all(os.path.exists(output) for output in entry['outputs'])
+
+    def has_outputs(self, key, flags, num_inputs):
+        """
+        Checks whether a build step has been done by a previous run, even if some of its input files have been removed since,
+        such as the JPG and RGB files removed by --wipe-jpg. Input files that still exist must not have changed.
+            :key: A unique key describing this build step.
+            :flags: A JSON serializable object describing the conversion options.
+            :num_inputs: The amount of input files this build step uses.
+        """
+        entry = self.entries.get(key)
+
+        if not entry or entry['flags'] != flags or len(entry['inputs']) != num_inputs:
+            return False
+
+        for path, stamp in entry['inputs'].items():
+            if os.path.exists(path) and not self.is_stamp_current(path, stamp):
+                return False
+
+        return bool(entry['outputs']) and all(os.path.exists(output) for output in entry['outputs'])
+
+    def get_result(self, key):
+        entry = self.entries.get(key)
+        return entry.get('result') if entry else None
+
+    def update(self, key, inputs, outputs, flags, result=None, stamps=None):
+        """
+        Remembers a finished build step.
+            :key: A unique key describing this build step.
+            :inputs: A list of input file paths.
+            :outputs: A list of output file paths.
+            :flags: A JSON serializable object describing the conversion options.
+            :result: Any JSON serializable result that should be returned for skipped steps.
+            :stamps: The stamps of the input files, as returned by get_stamps before they were read.
+                     Input files without a stamp are stamped now.
+        """
+        if not all(os.path.isfile(path) for path in inputs):
+            # Files inside Multifiles can't be stamped, so they are always converted again.
+            return
+
+        entry = {
+            'inputs': {path: stamps[path] if stamps and path in stamps else self.get_stamp(path) for path in inputs},
+            'outputs': outputs,
+            'flags': flags,
+            'result': result
+        }
+        self.entries[key] = entry
+        self.updates[key] = entry
+
+    def pop_updates(self):
+        updates = self.updates
+        self.updates = {}
+        return updates
+
+    def merge(self, updates):
+        self.entries.update(updates)
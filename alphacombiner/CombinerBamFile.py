@@ -1,4 +1,10 @@
 from p3bamboo.BamFile import BamFile
+from p3bamboo.BamFactory import BamFactory
+from p3bamboo.BamGlobals import BAMException
+from p3bamboo.StructDatagram import StructDatagramIterator
+from p3bamboo import BamGlobals
+from .Profiler import Profiler
+import mmap, os, re, struct
 
 """
   TOONTOWN ALPHA COMBINER
@@ -7,20 +13,219 @@ from p3bamboo.BamFile import BamFile
   Author: Disyer
   Date: 2020/06/13
 """
+
+# Alpha texture paths that --rgb rewrites.
+RGB_TEXTURE_PATTERN = re.compile(rb'\.rgb', re.IGNORECASE)
+
 class CombinerBamFile(BamFile):
 
-    def switch_texture_mode(self, convert_jpg, convert_rgb, convert_relative, base_folder):
+    def __init__(self, profiler=None):
+        BamFile.__init__(self)
+        self.profiler = profiler or Profiler()
+
+        # Used by the lazy loader: raw chunks of the BAM file,
+        # interleaved with the object IDs of the textures we've decoded.
+        self.segments = None
+        self.mapping = None
+
+    @staticmethod
+    def might_switch_texture_mode(data, convert_jpg, convert_rgb, convert_relative):
+        """
+        Quickly checks whether switch_texture_mode might modify a BAM file, without parsing it.
+        If this returns False, the model does not have to be parsed at all.
+        Only --rgb on its own can be checked this way: --jpg rewrites textures of any extension,
+        and --convert-relative strips leading slashes, so their textures always have to be decoded.
+            :data: The raw contents of the BAM file.
+        """
+        if convert_jpg or convert_relative:
+            return True
+
+        return convert_rgb and RGB_TEXTURE_PATTERN.search(data) is not None
+
+    def read_handle_at(self, data, offset):
+        """
+        Reads a type handle directly from the raw BAM data, registering it if it is new.
+        Returns the handle ID and the offset right after the handle.
+        """
+        handle_id, = struct.unpack_from('<H', data, offset)
+        offset += 2
+
+        if handle_id == 0 or handle_id in self.type_handles:
+            return handle_id, offset
+
+        name_length, = struct.unpack_from('<H', data, offset)
+        offset += 2
+        name = bytes(data[offset:offset + name_length]).decode('utf-8')
+        offset += name_length
+        num_parent_classes = data[offset]
+        offset += 1
+        parent_classes = []
+
+        for _ in range(num_parent_classes):
+            parent_id, offset = self.read_handle_at(data, offset)
+            parent_classes.append(parent_id)
+
+        self.type_handles[handle_id] = {'name': name, 'parent_classes': parent_classes}
+        return handle_id, offset
+
+    def read_pointer_at(self, data, offset):
+        if self.read_long_pointers:
+            return struct.unpack_from('<I', data, offset)[0], offset + 4
+
+        pointer, = struct.unpack_from('<H', data, offset)
+
+        if pointer == 0xFFFF:
+            self.read_long_pointers = True
+
+        return pointer, offset + 2
+
+    def load_lazy(self, data):
+        """
+        Loads a BAM file, only decoding its Texture objects.
+        Every other object is kept as raw bytes, and written back byte-for-byte by write_lazy.
+            :data: The raw contents of the BAM file, as any bytes-like object.
+        """
+        # Every slice we take from here on is a view into the original data, not a copy.
+        data = memoryview(data)
+
+        if data[:len(self.HEADER)] != self.HEADER:
+            raise BAMException('Invalid BAM header.')
+
+        offset = len(self.HEADER)
+        header_size, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        hdi = StructDatagramIterator(bytes(data[offset:offset + header_size]))
+        offset += header_size
+
+        self.bam_major_ver = hdi.get_uint16()
+        self.bam_minor_ver = hdi.get_uint16()
+        self.version = (self.bam_major_ver, self.bam_minor_ver)
+        self.file_endian = hdi.get_uint8() if self.version >= (5, 0) else 1
+        self.stdfloat_double = hdi.get_bool() if self.version >= (6, 27) else False
+
+        self.read_long_pointers = False
+        self.type_handles = {}
+        self.file_datas = []
+        self.objects.clear()
+        self.object_map = {}
+        self.segments = []
+
+        raw_start = 0
+
+        while offset < len(data):
+            start = offset
+            num_bytes, = struct.unpack_from('<I', data, offset)
+            offset += 4
+
+            if num_bytes == 0xFFFFFFFF:
+                num_bytes, = struct.unpack_from('<Q', data, offset)
+                offset += 8
+
+            dg_start = body_start = offset
+            offset += num_bytes
+
+            if self.version >= (6, 21):
+                opcode = data[body_start]
+                body_start += 1
+            else:
+                opcode = BamGlobals.BOC_adjunct
+
+            if opcode not in (BamGlobals.BOC_push, BamGlobals.BOC_adjunct):
+                # Nothing for us to change here.
+                continue
+
+            handle_id, pos = self.read_handle_at(data, body_start)
+            obj_id, pos = self.read_pointer_at(data, pos)
+
+            if self.type_handles[handle_id]['name'] != 'Texture':
+                continue
+
+            obj = {'handle_id': handle_id, 'handle_name': 'Texture', 'obj_id': obj_id, 'data': data[pos:offset]}
+            node = BamFactory.create(self, self.version, 'Texture')
+            node.obj_id = obj_id
+            node.load_buffer(obj['data'])
+
+            self.objects[obj_id] = obj
+            self.object_map[obj_id] = node
+
+            # Everything up until this texture can be copied as-is.
+            # The opcode, handle and pointer of the texture are kept as well.
+            self.segments.append(data[raw_start:start])
+            self.segments.append((obj_id, data[dg_start:pos]))
+            raw_start = offset
+
+        self.segments.append(data[raw_start:])
+
+    def map_file(self, f):
+        """
+        Memory-maps a BAM file, so that it can be passed to load_lazy without reading it.
+        Call close once you're done with this BAM file to release the mapping.
+            :f: The BAM file, opened in binary mode.
+        """
+        if os.fstat(f.fileno()).st_size == 0:
+            raise BAMException('Empty BAM file.')
+
+        self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mapping
+
+    def close(self):
+        """
+        Releases the memory-mapped file, if any.
+        All objects are dropped, as they may still point into the mapped file.
+        """
+        self.segments = None
+        self.objects.clear()
+        self.object_map = {}
+
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+    def write_lazy(self, f):
+        """
+        Writes a BAM file loaded by load_lazy.
+        Only the Texture objects are encoded again, everything else is copied byte-for-byte.
+        """
+        for segment in self.segments:
+            if not isinstance(segment, tuple):
+                f.write(segment)
+                continue
+
+            obj_id, prefix = segment
+            texture = self.object_map[obj_id]
+            header = texture.header_to_binary(self.version)
+            num_bytes = len(prefix) + len(header) + len(texture.texture_data)
+
+            if num_bytes >= 0xFFFFFFFF:
+                f.write(struct.pack('<IQ', 0xFFFFFFFF, num_bytes))
+            else:
+                f.write(struct.pack('<I', num_bytes))
+
+            f.write(prefix)
+            f.write(header)
+            f.write(texture.texture_data)
+
+    def switch_texture_mode(self, convert_jpg, convert_rgb, convert_relative, base_folder, get_num_channels=None):
+        """
+        Switches every JPG and RGB texture of this model to PNG.
+        Returns the old texture paths of every transformed texture, and whether the model has been modified.
+            :get_num_channels: Optionally returns the primary_file_num_channels of a transformed texture, given its old texture paths.
+        """
         all_transformations = []
         modified = False
 
-        for texture in self.get_objects_of_type('Texture'):
-            if convert_relative and texture.transform_relative(base_folder):
-                modified = True
+        with self.profiler.stage('switch_texture_mode', self.filename):
+            for texture in self.get_objects_of_type('Texture'):
+                if convert_relative and texture.transform_relative(base_folder):
+                    modified = True
+
+                transformation = texture.transform_to_png(convert_jpg, convert_rgb)
 
-            transformation = texture.transform_to_png(convert_jpg, convert_rgb)
+                if transformation and get_num_channels is not None:
+                    texture.primary_file_num_channels = get_num_channels(transformation)
 
-            if transformation and transformation not in all_transformations:
-                all_transformations.append(transformation)
-                modified = True
+                if transformation and transformation not in all_transformations:
+                    all_transformations.append(transformation)
+                    modified = True
 
         return all_transformations, modified
@@ -0,0 +1,163 @@
+import fnmatch, os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+# Every file is yielded as soon as its folder is listed, so that conversions can start
+# long before a large tree has been listed completely.
+
+def has_wildcards(pattern):
+    return any(char in pattern for char in '*?[')
+
+def is_png_output(path):
+    """
+    Is this one of our own converted files, such as a _png BAM file or a _png Multifile?
+        :path: The path of the file.
+    """
+    return os.path.splitext(os.path.basename(path))[0].endswith('_png')
+
+def list_dir(folder):
+    """
+    Returns the entries of a single folder, or nothing if it can't be listed.
+        :folder: The path of the folder, or an empty string for the working directory.
+    """
+    try:
+        with os.scandir(folder or os.curdir) as it:
+            return list(it)
+    except OSError:
+        return []
+
+def is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def scan_files(folder, extensions=None):
+    """
+    Yields every file inside a folder, recursively. Symlinked folders are not followed, just like os.walk.
+        :folder: The folder to list.
+        :extensions: If given, only files with one of these lowercase extensions are yielded.
+    """
+    folders = [folder]
+
+    while folders:
+        subfolders = []
+
+        for entry in list_dir(folders.pop()):
+            if is_dir(entry):
+                if not entry.is_symlink():
+                    subfolders.append(entry.path)
+            elif extensions is None or entry.name.lower().endswith(extensions):
+                yield entry.path
+
+        # Keep the order of os.walk: subfolders are listed in the order they were found.
+        folders.extend(reversed(subfolders))
+
+def match_parts(folder, parts, folders=False, entries=None):
+    """
+    Yields the files inside a folder that match the rest of a split pattern.
+        :folder: The folder the pattern is relative to.
+        :parts: The components of the pattern.
+        :folders: Should folders matching the pattern be yielded as well?
+        :entries: The entries of the folder, if it has already been listed.
+    """
+    part, rest = parts[0], parts[1:]
+
+    if part == '**':
+        # Any number of folders, including none at all. A trailing ** matches every file below, but no folders.
+        if not rest:
+            rest = ['*']
+            folders = False
+
+        # Every folder is only listed once, both to match the rest of the pattern and to find its subfolders.
+        entries = list_dir(folder)
+        yield from match_parts(folder, rest, folders, entries)
+
+        for entry in entries:
+            if not entry.name.startswith('.') and is_dir(entry):
+                yield from match_parts(entry.path, [part] + rest, folders)
+
+        return
+
+    if not has_wildcards(part):
+        path = os.path.join(folder, part)
+
+        if not rest:
+            if os.path.isfile(path) or (folders and os.path.isdir(path)):
+                yield path
+        elif os.path.isdir(path):
+            yield from match_parts(path, rest, folders)
+
+        return
+
+    # Just like glob, hidden files are only matched by patterns starting with a dot.
+    entries = {entry.name: entry for entry in (list_dir(folder) if entries is None else entries) if part.startswith('.') or not entry.name.startswith('.')}
+
+    for name in fnmatch.filter(entries, part):
+        entry = entries[name]
+
+        if rest:
+            if is_dir(entry):
+                yield from match_parts(entry.path, rest, folders)
+        elif folders or not is_dir(entry):
+            yield entry.path
+
+def find_paths(pattern, folders=False):
+    """
+    Yields the files matching a pattern, as soon as they are found.
+    * ? and [] match within a single folder or file name, and ** matches any number of folders.
+    Patterns without wildcards are yielded as they are, even if they don't exist, and so are existing paths.
+        :pattern: The path pattern, such as phase_*/models/**/*.bam.
+        :folders: Should folders matching the pattern be yielded as well, just like glob?
+    """
+    if not has_wildcards(pattern) or os.path.exists(pattern):
+        yield pattern
+        return
+
+    drive, path = os.path.splitdrive(os.path.normpath(pattern))
+    root = drive
+
+    if path.startswith(os.sep):
+        root += os.sep
+        path = path.lstrip(os.sep)
+
+    parts = path.split(os.sep)
+
+    # Start listing at the deepest folder without wildcards.
+    while not has_wildcards(parts[0]):
+        root = os.path.join(root, parts.pop(0))
+
+    yield from match_parts(root, parts, folders)
+
+class FileFilter(object):
+    """
+    Decides which of the files found are converted, using --include and --exclude patterns.
+    Patterns are matched against both the file name and the whole path, so *_gui.bam and */phase_3/* both work.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = list(include or ())
+        self.exclude = list(exclude or ())
+
+    def matches(self, path, patterns):
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+    def accepts(self, path):
+        """
+        Should this file be converted?
+            :path: The path of the file.
+        """
+        if self.include and not self.matches(path, self.include):
+            return False
+
+        return not (self.exclude and self.matches(path, self.exclude))
+
+    def filter(self, paths):
+        return (path for path in paths if self.accepts(path))
@@ -0,0 +1,151 @@
+import json, os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+class FileIndex(object):
+    VERSION = 1
+
+    def __init__(self, ignore_case=False, filename=None):
+        self.ignore_case = ignore_case
+        self.filename = filename
+
+        # Maps each scanned directory to its modification time, files and subdirectories.
+        self.dirs = {}
+
+        # Maps normalized file paths to their actual paths on disk.
+        self.files = {}
+        self.roots = []
+
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def normalize(self, path):
+        path = os.path.normcase(os.path.normpath(os.path.abspath(path)))
+        return path.lower() if self.ignore_case else path
+
+    def load(self):
+        with open(self.filename, 'r') as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                print(f'File index {self.filename} is corrupt, starting over...')
+                return
+
+        if data.get('version') == self.VERSION:
+            self.dirs = data.get('dirs', {})
+
+    def save(self):
+        if not self.filename:
+            return
+
+        temp_filename = self.filename + '.tmp'
+
+        with open(temp_filename, 'w') as f:
+            json.dump({'version': self.VERSION, 'dirs': self.dirs}, f)
+
+        os.replace(temp_filename, self.filename)
+
+    def scan_dir(self, path):
+        """
+        Lists a single directory, and recurses into its subdirectories.
+        Directories that have not changed since they were last scanned are not listed again.
+            :path: The absolute path of the directory.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.dirs.pop(path, None)
+            return
+
+        entry = self.dirs.get(path)
+
+        if entry is None or entry['mtime'] != mtime:
+            files = []
+            subdirs = []
+
+            with os.scandir(path) as it:
+                for dir_entry in it:
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        subdirs.append(dir_entry.name)
+                    else:
+                        files.append(dir_entry.name)
+
+            self.dirs[path] = entry = {'mtime': mtime, 'files': files, 'dirs': subdirs}
+
+        for file in entry['files']:
+            file = os.path.join(path, file)
+            self.files[self.normalize(file)] = file
+
+        for subdir in entry['dirs']:
+            self.scan_dir(os.path.join(path, subdir))
+
+    def add_folder(self, folder):
+        """
+        Indexes every file inside a folder.
+        Folders that have already been indexed during this run are skipped.
+            :folder: The folder to index.
+        """
+        if not folder or os.path.isfile(folder):
+            # Multifiles are indexed by themselves.
+            return
+
+        folder = os.path.abspath(folder)
+        root = self.normalize(folder)
+
+        if self.is_indexed(root):
+            return
+
+        self.scan_dir(folder)
+        self.roots.append(root)
+
+    def is_indexed(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return True
+
+        return False
+
+    def find(self, path):
+        """
+        Returns the actual path of a file on disk, or None if the file does not exist.
+        Paths outside of the indexed folders are checked on disk.
+            :path: The path of the file.
+        """
+        normalized = self.normalize(path)
+
+        if self.is_indexed(normalized):
+            return self.files.get(normalized)
+
+        return path if os.path.exists(path) else None
+
+    def exists(self, path):
+        return self.find(path) is not None
+
+    def discard(self, path):
+        self.files.pop(self.normalize(path), None)
+
+    def refresh(self, path):
+        """
+        Updates a single file that has been added or removed since its folder was indexed.
+            :path: The path of the file.
+        """
+        if os.path.exists(path):
+            self.files[self.normalize(path)] = path
+        else:
+            self.discard(path)
+
+    def iter_files(self, folder):
+        """
+        Yields every indexed file inside a folder.
+            :folder: The folder to list, which must have been added with add_folder.
+        """
+        root = self.normalize(folder).rstrip(os.sep) + os.sep
+
+        for normalized, path in self.files.items():
+            if normalized.startswith(root):
+                yield path
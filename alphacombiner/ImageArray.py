@@ -0,0 +1,69 @@
+from panda3d.core import PNMImage, Texture
+import numpy as np
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+# Texture formats, by number of channels: gray, gray+alpha, RGB, RGBA.
+TEXTURE_FORMATS = {1: Texture.F_luminance, 2: Texture.F_luminance_alpha, 3: Texture.F_rgb, 4: Texture.F_rgba}
+
+def get_pixels(image):
+    """
+    Returns the pixels of an image as a 3D array of rows, columns and channels:
+    top row first, channels in RGBA order, 8 or 16 bits per channel.
+        :image: A PNMImage with a maxval of 255 or 65535.
+    """
+    texture = Texture()
+    texture.load(image)
+
+    num_channels = image.get_num_channels()
+    dtype = np.uint8 if image.get_maxval() == 255 else np.uint16
+    pixels = np.frombuffer(texture.get_ram_image(), dtype=dtype)
+    pixels = pixels.reshape(image.get_y_size(), image.get_x_size(), num_channels)
+
+    # Panda3D stores textures bottom row first, in BGR(A) order.
+    pixels = pixels[::-1]
+
+    if num_channels >= 3:
+        pixels = pixels[:, :, [2, 1, 0, 3][:num_channels]]
+
+    return pixels
+
+def scale_pixels(pixels, dtype):
+    """
+    Returns a copy of an array returned by get_pixels, scaled to 8 or 16 bits per channel.
+    Values are rounded to the nearest value, just like PNMImage does when copying between maxvals.
+        :pixels: A uint8 or uint16 array.
+        :dtype: np.uint8 or np.uint16.
+    """
+    if pixels.dtype == dtype:
+        return np.array(pixels)
+
+    if dtype == np.uint8:
+        return ((pixels.astype(np.uint32) + 128) // 257).astype(np.uint8)
+
+    return pixels.astype(np.uint16) * 257
+
+def make_image(pixels):
+    """
+    Turns an array returned by get_pixels back into a PNMImage.
+        :pixels: A 3D uint8 or uint16 array of rows, columns and channels, top row first.
+    """
+    y_size, x_size, num_channels = pixels.shape
+    component_type = Texture.T_unsigned_byte if pixels.dtype == np.uint8 else Texture.T_unsigned_short
+
+    if num_channels >= 3:
+        pixels = pixels[:, :, [2, 1, 0, 3][:num_channels]]
+
+    texture = Texture()
+    texture.setup_2d_texture(x_size, y_size, component_type, TEXTURE_FORMATS[num_channels])
+    texture.set_ram_image(np.ascontiguousarray(pixels[::-1]).tobytes())
+
+    image = PNMImage()
+    texture.store(image)
+    return image
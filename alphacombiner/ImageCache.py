@@ -0,0 +1,128 @@
+from collections import OrderedDict
+import threading
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+class ImageCache(object):
+
+    def __init__(self, budget_mb=0):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.images = OrderedDict()
+        self.size = 0
+        self.peak_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The cache is shared by the threads of the conversion pipeline.
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def get_image_size(self, image):
+        """
+        Returns roughly how much memory a decoded image takes up.
+        PNMImage always stores three 16-bit components per pixel, plus a 16-bit alpha if present.
+            :image: A PNMImage.
+        """
+        pixel_size = 8 if image.has_alpha() else 6
+        return image.get_x_size() * image.get_y_size() * pixel_size
+
+    def get(self, key):
+        """
+        Returns a cached image, or None if it is not cached.
+        The image is shared with the cache, so it must not be modified.
+            :key: The key of the image, usually its path.
+        """
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            image = self.images.get(key)
+
+            if image is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        """
+        Adds an image to the cache, evicting the least recently used images if needed.
+        Returns True if the image has been cached.
+            :key: The key of the image, usually its path.
+            :image: A decoded PNMImage.
+        """
+        size = self.get_image_size(image)
+
+        if not self.enabled or size > self.budget:
+            return False
+
+        with self.lock:
+            self.discard(key)
+
+            while self.images and self.size + size > self.budget:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= self.get_image_size(evicted)
+                self.evictions += 1
+
+            self.images[key] = image
+            self.size += size
+            self.peak_size = max(self.peak_size, self.size)
+            return True
+
+    def remove(self, key):
+        """
+        Removes an image from the cache, such as when its file has changed.
+        Images made from it, whose keys are tuples starting with its key, such as resized alpha textures, are removed as well.
+            :key: The key of the image, usually its path.
+        """
+        with self.lock:
+            self.discard(key)
+
+            for derived_key in [k for k in self.images if isinstance(k, tuple) and k[0] == key]:
+                self.discard(derived_key)
+
+    def discard(self, key):
+        # The lock must be held by the caller.
+        image = self.images.pop(key, None)
+
+        if image is not None:
+            self.size -= self.get_image_size(image)
+
+    def pop_stats(self):
+        """
+        Returns and resets the hit, miss and eviction counts.
+        Used by worker processes to report back to the parent process.
+        """
+        stats = (self.hits, self.misses, self.evictions, self.peak_size)
+        self.hits = self.misses = self.evictions = 0
+        self.peak_size = self.size
+        return stats
+
+    def merge_stats(self, stats):
+        """
+        Adds the counts of another image cache to ours.
+            :stats: The result of pop_stats.
+        """
+        hits, misses, evictions, peak_size = stats
+        self.hits += hits
+        self.misses += misses
+        self.evictions += evictions
+        self.peak_size = max(self.peak_size, peak_size)
+
+    def print_stats(self):
+        if not self.enabled or not (self.hits or self.misses):
+            return
+
+        total = self.hits + self.misses
+        print(f'Image cache: {self.hits} hits, {self.misses} misses ({self.hits * 100 / total:.1f}% hit rate), '
+              f'{self.evictions} evictions, peak usage {self.peak_size / (1024 * 1024):.1f} MB of {self.budget / (1024 * 1024):.1f} MB.')
@@ -1,5 +1,19 @@
-from panda3d.core import Filename, PNMImage, PNMFileTypeRegistry
-import os
+from panda3d.core import Filename, PNMImage, PNMFileTypeRegistry, StringStream, Texture
+from .AlphaAnalysis import ALPHA_BINARY, ALPHA_OPAQUE, analyze_alpha, get_gray_channel
+from .ImageArray import get_pixels, make_image, scale_pixels
+from .FileDiscovery import FileFilter, scan_files
+from .ImageCache import ImageCache
+from .Pipeline import Pipeline
+from .ImageOptions import DEDUP_MODES, PNG_FILTERS, RESIZE_FILTERS
+from .OutputDedup import OutputDedup, link_file, unlink_shared
+from .PngEncoder import can_encode, encode_panda_png, encode_png
+from .Profiler import Profiler
+from .SgiImage import is_panda_compatible, read_sgi, write_sgi
+from .TextureIndex import resolve_texture_path
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import numpy as np
+import contextlib, io, os, time
 
 """
   TOONTOWN ALPHA COMBINER
@@ -11,29 +25,624 @@ import os
 
 RGB_TYPE = PNMFileTypeRegistry.get_global_ptr().get_type_from_extension('.rgb')
 
+# PNMImage stores grayscale values in the blue component of each pixel,
+# so the "gray" channel of any image is always found at index 2.
+GRAY_CHANNEL = 2
+ALPHA_CHANNEL = 3
+
+# Toontown textures whose grayscale RGB files are used as they are, instead of as their own alpha channel.
+GRAY_ONLY_TEXTURES = ('golf_ball', 'roll-o-dex')
+
+# The methods preparing the job of each conversion method, so that jobs can be deduplicated before they run.
+PREPARE_METHODS = {'convert_texture': 'prepare_texture', 'convert_png_to_jpg_rgb': 'prepare_png_to_jpg_rgb'}
+
+# Every worker process in the pool keeps its own converter around.
+worker_converter = None
+
+def init_worker(options):
+    global worker_converter
+    worker_converter = ImageConverter(**options)
+
+def run_worker(method_name, *args):
+    """
+    Runs a conversion method inside a worker process.
+    Output is captured, so that the parent process can print it in a stable order.
+    """
+    output = io.StringIO()
+    error = None
+    cache_updates = None
+    archive_changes = None
+
+    with contextlib.redirect_stdout(output):
+        try:
+            getattr(worker_converter, method_name)(*args)
+        except Exception as e:
+            error = e
+
+    if worker_converter.cache is not None:
+        # Hand our cache entries back to the parent process, which owns the cache file.
+        cache_updates = worker_converter.cache.pop_updates()
+
+    if worker_converter.archives is not None:
+        # Files written into Multifiles are saved by the parent process as well.
+        archive_changes = worker_converter.archives.pop_changes()
+
+    return output.getvalue(), error, cache_updates, worker_converter.profiler.pop_records(), worker_converter.image_cache.pop_stats(), archive_changes, worker_converter.pop_errors()
+
+class ImageJob(object):
+    """
+    A single image conversion, handed from one conversion stage to the next.
+    """
+
+    def __init__(self, kind, path, inputs, wipe=(), stamps=None):
+        # The kind and path identify this conversion in the build cache.
+        self.kind = kind
+        self.path = path
+        self.inputs = inputs
+        # The state of our input files before they were read, remembered in the build cache.
+        self.stamps = stamps
+        self.wipe = list(wipe)
+        # Jobs with identical inputs, which receive copies of our output files.
+        self.copies = []
+        self.data = {}
+        self.images = {}
+        self.shared = set()
+        self.outputs = []
+
 class ImageConverter(object):
 
-    def __init__(self, model_path, early_exit=False):
+    def __init__(self, model_path, early_exit=False, jobs=1, cache=None, file_index=None, profiler=None, resize_filter='gaussian', image_cache_mb=0, pipeline=False, queue_size=4, png_compression=6, png_filter='default', archives=None, dedup='off', analyze_alpha=False, file_filter=None):
+        if resize_filter not in RESIZE_FILTERS:
+            raise ValueError(f'Unknown resize filter: {resize_filter}')
+
+        if png_filter not in PNG_FILTERS:
+            raise ValueError(f'Unknown PNG filter: {png_filter}')
+
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f'Unknown dedup mode: {dedup}')
+
         self.model_path = model_path
         self.early_exit = early_exit
-        self.converted_so_far = []
+        self.jobs = jobs or os.cpu_count()
+        self.cache = cache
+        self.file_index = file_index
+        self.profiler = profiler or Profiler()
+        self.resize_filter = resize_filter
+        self.image_cache = ImageCache(image_cache_mb)
+        self.converted_so_far = set()
+        self.executor = None
+        self.pending_jobs = deque()
+        self.pipelined = pipeline
+        self.queue_size = queue_size
+        self.pipeline = None
+        self.png_compression = png_compression
+        self.png_filter = png_filter
+        self.archives = archives
+        # The errors reported so far, for callers that don't read our output.
+        self.errors = []
+        self.dedup = OutputDedup(dedup)
+        self.analyze_alpha = analyze_alpha
+        # Alpha textures are often shared by many JPGs as well, so we only analyze them once.
+        self.alpha_types = {}
+        # Decides which of the files found in the model path are converted.
+        self.file_filter = file_filter or FileFilter()
 
     def print_exc(self, *args):
         if self.early_exit:
             raise Exception(' '.join(args))
 
+        self.errors.append(' '.join(args))
         print(*args)
 
-    def read_texture(self, filename, alpha=False):
+    def pop_errors(self):
+        errors = self.errors
+        self.errors = []
+        return errors
+
+    def get_worker_options(self):
         """
-        Reads a texture from the model path.
-        Throws a PalettizerException if file could not be found.
-            :filename: Relative filename pointing to a texture file in the model path.
-            :alpha: Do we need an alpha channel?
+        Returns the keyword arguments used to create the converters of our worker processes.
+        """
+        return {
+            'model_path': self.model_path,
+            'early_exit': self.early_exit,
+            'cache': self.cache,
+            'file_index': self.file_index,
+            'profiler': Profiler(self.profiler.enabled),
+            'resize_filter': self.resize_filter,
+            'image_cache_mb': self.image_cache.budget / (1024 * 1024),
+            'png_compression': self.png_compression,
+            'png_filter': self.png_filter,
+            'archives': self.archives,
+            'dedup': self.dedup.mode,
+            'analyze_alpha': self.analyze_alpha
+        }
+
+    def is_archived(self, path):
+        """
+        Is this path inside a Multifile?
+            :path: The path of the file.
+        """
+        return self.archives is not None and self.archives.contains(path)
+
+    def find_path(self, path):
+        """
+        Returns the actual path of a file, or None if it does not exist.
+        Uses the file index if we have one, instead of hitting the disk.
+        Files that are not on disk are looked up inside our Multifiles.
+            :path: The path of the file.
+        """
+        if self.file_index is not None:
+            found_path = self.file_index.find(path)
+        else:
+            found_path = path if os.path.exists(path) else None
+
+        if found_path is None and self.archives is not None:
+            found_path = self.archives.find(path)
+
+        return found_path
+
+    def iter_files(self, folder):
+        """
+        Yields every file inside a folder that passes our file filter, recursively, as soon as it is found.
+            :folder: The folder to list, or a Multifile.
+        """
+        yield from self.file_filter.filter(self.list_files(folder))
+
+    def list_files(self, folder):
+        if self.is_archived(folder):
+            yield from self.archives.iter_files(folder)
+            return
+
+        if self.file_index is not None:
+            self.file_index.add_folder(folder)
+            yield from self.file_index.iter_files(folder)
+        else:
+            yield from scan_files(folder)
+
+        if self.archives is not None:
+            # Also list the files of the Multifiles mounted onto this folder.
+            yield from self.archives.iter_files(folder)
+
+    def get_cache_flags(self):
+        """
+        Returns every option that affects the image output.
+        Cached images that were converted with different options are converted again.
+        """
+        return {
+            'resize_filter': self.resize_filter,
+            'png_compression': self.png_compression,
+            'png_filter': self.png_filter,
+            'analyze_alpha': self.analyze_alpha
+        }
+
+    def is_cached(self, kind, path, inputs):
+        """
+        Checks whether an image has already been converted by a previous run.
+            :kind: The kind of conversion, such as 'png' or 'jpg'.
+            :path: The path identifying this conversion.
+            :inputs: The list of input files used by this conversion.
+        """
+        if self.cache is None or not self.cache.is_up_to_date(f'{kind}:{path}', inputs, self.get_cache_flags()):
+            return False
+
+        print('Already up to date:', path)
+        return True
+
+    def is_converted(self, kind, path, num_inputs):
+        """
+        Checks whether an image has been converted by a previous run, without looking for its input files,
+        which might have been removed by --wipe-jpg since.
+            :kind: The kind of conversion, such as 'png' or 'jpg'.
+            :path: The path identifying this conversion.
+            :num_inputs: The amount of input files used by this conversion.
+        """
+        if self.cache is None or not self.cache.has_outputs(f'{kind}:{path}', self.get_cache_flags(), num_inputs):
+            return False
+
+        print('Already up to date:', path)
+        return True
+
+    def get_input_stamps(self, inputs):
+        return self.cache.get_stamps(inputs) if self.cache is not None else None
+
+    def update_cache(self, job, outputs):
+        if self.cache is not None:
+            self.cache.update(f'{job.kind}:{job.path}', job.inputs, outputs, self.get_cache_flags(), stamps=job.stamps)
+
+    def submit_job(self, method_name, *args):
+        """
+        Runs a conversion method, either immediately or on the process pool.
+        In pipeline mode, the method hands its work to the pipeline threads instead.
+            :method_name: The name of the ImageConverter method to call.
+            :args: The arguments to pass to the method.
         """
+        if self.dedup.enabled and method_name in PREPARE_METHODS:
+            # Jobs are prepared right away, so that identical inputs are found before any of them runs.
+            self.add_dedup_job(getattr(self, PREPARE_METHODS[method_name])(*args))
+            return
+
+        if self.jobs <= 1 or self.pipelined:
+            getattr(self, method_name)(*args)
+            return
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.jobs, initializer=init_worker, initargs=(self.get_worker_options(),))
+
+        self.pending_jobs.append(self.executor.submit(run_worker, method_name, *args))
+        self.collect_jobs(wait=False)
+
+    def collect_jobs(self, wait=True):
+        """
+        Prints the output of finished jobs in the order they were submitted.
+        If a job has failed, all outstanding jobs are cancelled and the error is raised.
+            :wait: Should we wait for every outstanding job to finish?
+        """
+        if wait and self.dedup.jobs:
+            self.run_dedup_jobs()
+
+        try:
+            if self.pipeline is not None and wait:
+                self.pipeline.join()
+
+            while self.pending_jobs and (wait or self.pending_jobs[0].done()):
+                output, error, cache_updates, profile_records, image_cache_stats, archive_changes, errors = self.pending_jobs.popleft().result()
+                print(output, end='')
+                self.errors.extend(errors)
+
+                if cache_updates:
+                    self.cache.merge(cache_updates)
+
+                self.profiler.merge(profile_records)
+                self.image_cache.merge_stats(image_cache_stats)
+
+                if archive_changes:
+                    self.archives.merge(archive_changes)
+
+                if error is not None:
+                    raise error
+        except BaseException:
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        """
+        Cancels all outstanding jobs and stops the process pool and the pipeline.
+        """
+        if self.pipeline is not None:
+            self.pipeline.close()
+            self.pipeline = None
+
+        for job in self.pending_jobs:
+            job.cancel()
+
+        self.pending_jobs.clear()
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def is_gray_only(self, tex_path):
+        return any(name in tex_path for name in GRAY_ONLY_TEXTURES)
+
+    def get_content_key(self, job):
+        """
+        Returns a key made of everything the output of a job depends on: its kind, and the type and contents of its input files.
+        Jobs with the same key have identical output files.
+            :job: The ImageJob.
+        """
+        key = [job.kind, self.is_gray_only(job.inputs[0])]
+
+        for path in job.inputs:
+            key.append(os.path.splitext(path)[1].lower())
+            key.append(self.dedup.get_file_hash(path, lambda path: self.read_file(path, 'hash')))
+
+        return tuple(key)
+
+    def add_dedup_job(self, job):
+        """
+        Queues a job until the next time jobs are collected, unless its inputs are identical to a queued job.
+            :job: The ImageJob, or None if there is nothing to do.
+        """
+        if job is not None and self.dedup.add(self.get_content_key(job), job):
+            print(f'Identical to an earlier image: {job.path}')
+
+    def run_dedup_jobs(self):
+        """
+        Runs the first job of every distinct input. The other jobs receive copies of their output files once they are written.
+        """
+        jobs = self.dedup.pop_jobs()
+        start = time.perf_counter()
+
+        for job in jobs:
+            self.submit_job('run_job', job)
+
+        self.collect_jobs()
+        bytes_saved = 0
+
+        for job in jobs:
+            for copy in job.copies:
+                for path in self.get_output_paths(job):
+                    copy_path = self.get_copy_path(job, copy, path)
+
+                    if not self.is_archived(copy_path) and os.path.exists(path) and os.path.exists(copy_path) and os.path.samefile(path, copy_path):
+                        bytes_saved += os.path.getsize(copy_path)
+
+        self.dedup.add_stats(jobs, time.perf_counter() - start, bytes_saved)
+
+    def get_output_paths(self, job):
+        """
+        Returns every output file a job may write.
+            :job: The ImageJob.
+        """
+        if job.kind == 'jpg':
+            tex_basename = os.path.splitext(job.path)[0]
+            return [tex_basename + '.jpg', tex_basename + '_a.rgb']
+
+        return [job.path]
+
+    def get_copy_path(self, job, copy, path):
+        """
+        Returns where a copy of an output file of a job goes.
+            :job: The ImageJob that wrote the file.
+            :copy: The ImageJob with identical inputs.
+            :path: The path of the output file.
+        """
+        return os.path.splitext(copy.path)[0] + path[len(os.path.splitext(job.path)[0]):]
+
+    def get_stages(self):
+        """
+        Returns every stage of an image conversion, as (name, function, thread count) tuples.
+        """
+        return [
+            ('read', self.read_job, 1),
+            ('decode', self.decode_job, self.jobs),
+            ('process', self.process_job, self.jobs),
+            ('encode', self.encode_job, self.jobs),
+            ('write', self.write_job, 1)
+        ]
+
+    def run_job(self, job):
+        """
+        Runs an image conversion through every stage.
+        In pipeline mode, the job is queued up, so that reading and writing files overlaps with decoding and encoding images.
+            :job: The ImageJob to run, or None if there is nothing to do.
+        """
+        if job is None:
+            return
+
+        if self.pipelined:
+            if self.pipeline is None:
+                self.pipeline = Pipeline(self.get_stages(), self.queue_size)
+
+            try:
+                self.pipeline.put(job)
+            except BaseException:
+                self.shutdown()
+                raise
+
+            return
+
+        for _, function, _ in self.get_stages():
+            job = function(job)
+
+            if job is None:
+                return
+
+    def read_file(self, path, stage_name='read'):
+        with self.profiler.stage(stage_name, path) as stage:
+            if self.is_archived(path):
+                data = self.archives.read(path)
+            else:
+                with open(path, 'rb') as f:
+                    data = f.read()
+
+            stage.add_read_size(len(data))
+
+        return data
+
+    def decode_image(self, path, data):
+        """
+        Decodes an image that has been read into memory.
+            :path: The path of the image file, used to detect its type.
+            :data: The contents of the image file.
+        """
+        img = PNMImage()
+        is_rgb = path.lower().endswith('.rgb')
+
+        with self.profiler.stage('decode', path) as stage:
+            if (is_rgb and not is_panda_compatible(data)) or not img.read(StringStream(data), os.path.basename(path)):
+                img = self.decode_fallback(path, data)
+
+            stage.add_pixels(img)
+
+        return img
+
+    def decode_fallback(self, path, data):
+        """
+        Decodes an image that Panda3D could not read properly.
+        RGB files are decoded by our own SGI reader, other files get a few more tries straight from the disk.
+            :path: The path of the image file.
+            :data: The contents of the image file.
+        """
+        if path.lower().endswith('.rgb'):
+            try:
+                return make_image(read_sgi(data))
+            except ValueError as e:
+                print(f'Could not decode {path}: {e}')
+
         img = PNMImage()
-        img.read(Filename.from_os_specific(filename))
+        self.load_img_with_retry(img, path)
+        return img
+
+    def read_job(self, job):
+        """
+        Reads the input files of a job, unless their decoded images are still cached.
+            :job: The ImageJob to read.
+        """
+        for path in job.inputs:
+            img = self.image_cache.get(os.path.normcase(path))
+
+            if img is not None:
+                job.images[path] = img
+                job.shared.add(path)
+            else:
+                job.data[path] = self.read_file(path)
+
+        return job
+
+    def decode_job(self, job):
+        """
+        Decodes the input files of a job.
+            :job: The ImageJob to decode.
+        """
+        for path, data in job.data.items():
+            img = self.decode_image(path, data)
+            job.images[path] = img
+
+            if img.is_valid() and self.image_cache.put(os.path.normcase(path), img):
+                job.shared.add(path)
+
+        job.data.clear()
+        return job
+
+    def get_job_image(self, job, path, writable=False):
+        """
+        Returns a decoded input image of a job.
+            :job: The ImageJob.
+            :path: The path of the input file.
+            :writable: Will the image be modified? If so, images shared with the image cache are copied.
+        """
+        img = job.images[path]
+        return PNMImage(img) if writable and path in job.shared else img
+
+    def process_job(self, job):
+        if job.kind == 'jpg':
+            return self.process_jpg(job)
+
+        return self.process_png(job)
 
+    def encode_job(self, job):
+        """
+        Encodes the output images of a job into memory.
+            :job: The ImageJob to encode.
+        """
+        encoded = []
+
+        for path, img in job.outputs:
+            extension = os.path.splitext(path)[1][1:].lower()
+
+            with self.profiler.stage('encode_' + extension, path) as stage:
+                data = self.encode_image(path, img)
+
+                if data is None:
+                    return None
+
+                stage.add_pixels(img)
+                stage.add_written_size(len(data))
+
+            encoded.append((path, data))
+
+        job.outputs = encoded
+        return job
+
+    def encode_image(self, path, img):
+        """
+        Encodes an image into memory, using our own PNG encoder if a PNG filter has been chosen.
+        Returns None if the image could not be encoded.
+            :path: The path of the output file, used to choose its type.
+            :img: The PNMImage to encode.
+        """
+        if path.lower().endswith('.png'):
+            if self.png_filter != 'default' and can_encode(img):
+                return encode_png(img, self.png_compression, self.png_filter)
+
+            # Panda3D's PNG writer is still used with the default filter, and for odd bit depths.
+            return encode_panda_png(img, self.png_compression)
+
+        if path.lower().endswith('.rgb') and img.get_maxval() == 65535 and can_encode(img):
+            # Panda3D rounds off 16-bit values when writing RGB files.
+            return write_sgi(get_pixels(img))
+
+        stream = StringStream()
+
+        if not img.write(stream, os.path.basename(path)):
+            return None
+
+        return stream.data
+
+    def write_job(self, job):
+        """
+        Writes the encoded output files of a job, and removes its source files if requested.
+            :job: The ImageJob to write.
+        """
+        written = []
+
+        for path, data in job.outputs:
+            with self.profiler.stage('write', path) as stage:
+                if self.is_archived(path):
+                    self.archives.write(path, data)
+                else:
+                    # Files linked by an earlier run must not change along with this one.
+                    unlink_shared(path)
+
+                    with open(path, 'wb') as f:
+                        f.write(data)
+
+                stage.add_written_size(len(data))
+
+            written.append(path)
+
+        self.update_cache(job, written)
+
+        for path in job.wipe:
+            print('Removing old', path + '...')
+            self.remove_file(path)
+
+        for copy in job.copies:
+            self.write_copy(job, copy)
+
+    def write_copy(self, job, copy):
+        """
+        Links or copies the output files of a job to the destination of a job with identical inputs.
+            :job: The ImageJob that has just been written.
+            :copy: The ImageJob with identical inputs.
+        """
+        written = []
+
+        for path, data in job.outputs:
+            copy_path = self.get_copy_path(job, copy, path)
+
+            with self.profiler.stage('dedup', copy_path) as stage:
+                if self.dedup.mode == 'link' and not self.is_archived(path) and not self.is_archived(copy_path) and link_file(path, copy_path):
+                    print(f'Linking {copy_path} to {path}...')
+                else:
+                    print(f'Copying {path} to {copy_path}...')
+
+                    if self.is_archived(copy_path):
+                        self.archives.write(copy_path, data)
+                    else:
+                        unlink_shared(copy_path)
+
+                        with open(copy_path, 'wb') as f:
+                            f.write(data)
+
+                    stage.add_written_size(len(data))
+
+            written.append(copy_path)
+
+        self.update_cache(copy, written)
+
+        for path in copy.wipe:
+            print('Removing old', path + '...')
+            self.remove_file(path)
+
+    def set_texture_alpha(self, img, alpha=False):
+        """
+        Adds or removes the alpha channel of a texture.
+            :img: The PNMImage of the texture, which is modified.
+            :alpha: Do we need an alpha channel?
+        """
         if alpha:
             needs_alpha_fill = img.num_channels not in (2, 4)
             img.set_color_type(4)
@@ -49,7 +658,7 @@ class ImageConverter(object):
 
     def resize_image(self, image, x_size, y_size):
         """
-        Resize an image using the Gaussian blur algorithm.
+        Resize an image using the resize filter of this converter.
             :image: A PNMImage representing your image data.
             :x_size: The desired X size of the texture.
             :y_size: The desired Y size of the texture.
@@ -58,15 +667,152 @@ class ImageConverter(object):
             # This image does not need to be resized!
             return image
 
-        print(f'Implicit resize from ({image.get_x_size()}, {image.get_y_size()}) to {x_size, y_size}')
+        print(f'Implicit resize from ({image.get_x_size()}, {image.get_y_size()}) to {x_size, y_size} using {self.resize_filter} filter')
+
+        if self.resize_filter == 'bilinear':
+            return self.bilinear_resize(image, x_size, y_size)
 
-        # Resize the image using Panda3D's gaussian filter algorithm, to fit our x_size and y_size.
-        # WARNING! This blurs the image if too small!!! (Gaussian blur)
         new_image = PNMImage(x_size, y_size, image.get_num_channels(), image.get_maxval(), image.get_type())
-        new_image.gaussian_filter_from(1.0, image)
 
+        if self.resize_filter == 'nearest':
+            new_image.unfiltered_stretch_from(image)
+        elif self.resize_filter == 'box':
+            new_image.box_filter_from(1.0, image)
+        else:
+            # Resize the image using Panda3D's gaussian filter algorithm, to fit our x_size and y_size.
+            # WARNING! This blurs the image if too small!!! (Gaussian blur)
+            new_image.gaussian_filter_from(1.0, image)
+
+        return new_image
+
+    def bilinear_resize(self, image, x_size, y_size):
+        """
+        Resize a grayscale image using bilinear interpolation.
+        The pixels are resampled as a whole using NumPy, instead of one by one.
+            :image: A one channel PNMImage representing your image data.
+            :x_size: The desired X size of the texture.
+            :y_size: The desired Y size of the texture.
+        """
+        texture = Texture()
+        texture.load(image)
+
+        dtype = np.uint8 if texture.get_component_type() == Texture.T_unsigned_byte else np.uint16
+        pixels = np.frombuffer(texture.get_ram_image(), dtype=dtype)
+        pixels = pixels.reshape(image.get_y_size(), image.get_x_size()).astype(np.float32)
+
+        def get_weights(old_size, new_size):
+            # Sample at the center of every new pixel.
+            coords = (np.arange(new_size, dtype=np.float32) + 0.5) * (old_size / new_size) - 0.5
+            coords = np.clip(coords, 0, old_size - 1)
+            low = np.floor(coords).astype(np.intp)
+            high = np.minimum(low + 1, old_size - 1)
+            return low, high, coords - low
+
+        x_low, x_high, x_weight = get_weights(image.get_x_size(), x_size)
+        y_low, y_high, y_weight = get_weights(image.get_y_size(), y_size)
+
+        rows = pixels[y_low] * (1 - y_weight[:, None]) + pixels[y_high] * y_weight[:, None]
+        pixels = rows[:, x_low] * (1 - x_weight) + rows[:, x_high] * x_weight
+
+        new_texture = Texture()
+        new_texture.setup_2d_texture(x_size, y_size, texture.get_component_type(), Texture.F_luminance)
+        new_texture.set_ram_image(np.rint(pixels).astype(dtype).tobytes())
+
+        new_image = PNMImage(x_size, y_size, 1, image.get_maxval(), image.get_type())
+        new_texture.store(new_image)
         return new_image
 
+    def get_gray_image(self, image):
+        """
+        Returns a one channel copy of the gray channel of an image.
+            :image: A PNMImage with any amount of channels.
+        """
+        if image.get_num_channels() == 1:
+            return image
+
+        gray_image = PNMImage(image.get_x_size(), image.get_y_size(), 1, image.get_maxval(), image.get_type())
+        gray_image.copy_channel(image, GRAY_CHANNEL, GRAY_CHANNEL)
+        return gray_image
+
+    def resize_alpha(self, alpha_path, alpha_img, x_size, y_size):
+        """
+        Resizes an alpha texture to the size of its JPG.
+        Resized alpha textures are kept in the image cache, so that alphas shared by
+        multiple JPGs are only resized once.
+            :alpha_path: The path of the RGB file.
+            :alpha_img: The decoded RGB file.
+            :x_size: The X size of the JPG.
+            :y_size: The Y size of the JPG.
+        """
+        if alpha_img.get_x_size() == x_size and alpha_img.get_y_size() == y_size:
+            return alpha_img
+
+        key = (os.path.normcase(alpha_path), x_size, y_size)
+        resized_img = self.image_cache.get(key)
+
+        if resized_img is not None:
+            return resized_img
+
+        with self.profiler.stage('resize', alpha_path) as stage:
+            # We only need the gray channel, so don't bother resizing the others.
+            alpha_img = self.resize_image(self.get_gray_image(alpha_img), x_size, y_size)
+            stage.add_pixels(alpha_img)
+
+        self.image_cache.put(key, alpha_img)
+        return alpha_img
+
+    def get_alpha_type(self, path, image, gray=False):
+        """
+        Returns whether the alpha of an image is opaque, binary or blended, or None if it can't be analyzed.
+        Alpha textures are only analyzed once.
+            :path: The path of the image.
+            :image: The decoded image.
+            :gray: Analyze the gray channel, like the alpha textures of JPGs, instead of the alpha channel?
+        """
+        key = (os.path.normcase(path), gray)
+
+        if key in self.alpha_types:
+            return self.alpha_types[key]
+
+        if image.get_maxval() not in (255, 65535) or (not gray and not image.has_alpha()):
+            return None
+
+        with self.profiler.stage('alpha_analysis', path) as stage:
+            pixels = get_pixels(image)
+            alpha_type = analyze_alpha(get_gray_channel(pixels) if gray else pixels[:, :, -1])
+            stage.add_pixels(image)
+
+        if alpha_type == ALPHA_BINARY:
+            print(f'Alpha of {path} is either fully opaque or fully transparent')
+
+        self.alpha_types[key] = alpha_type
+        return alpha_type
+
+    def copy_gray_to_alpha(self, dest_image, source_image, maxval=None):
+        """
+        Copies the gray channel of an image into the alpha channel of another image, and returns the result.
+        The whole channel is copied at once on the pixel arrays of both images. PNMImage's copy_channel,
+        which goes pixel by pixel, is only used for images that can't be turned into arrays.
+            :dest_image: A four channel PNMImage that will receive the alpha channel.
+            :source_image: A PNMImage of the same size, used as the alpha source.
+            :maxval: The maxval of the result, scaling both images to it. Defaults to the maxval of dest_image.
+        """
+        maxval = maxval or dest_image.get_maxval()
+
+        if maxval not in (255, 65535) or any(image.get_maxval() not in (255, 65535) for image in (dest_image, source_image)):
+            if dest_image.get_maxval() != maxval:
+                output_img = PNMImage(dest_image.get_x_size(), dest_image.get_y_size(), 4, maxval)
+                output_img.copy_sub_image(dest_image, 0, 0, 0, 0, dest_image.get_x_size(), dest_image.get_y_size())
+                dest_image = output_img
+
+            dest_image.copy_channel(source_image, GRAY_CHANNEL, ALPHA_CHANNEL)
+            return dest_image
+
+        dtype = np.uint8 if maxval == 255 else np.uint16
+        pixels = scale_pixels(get_pixels(dest_image), dtype)
+        pixels[:, :, ALPHA_CHANNEL] = pixels[:, :, GRAY_CHANNEL] if source_image is dest_image else scale_pixels(get_gray_channel(get_pixels(source_image)), dtype)
+        return make_image(pixels)
+
     def load_img_with_retry(self, img, tex_path):
         retry = 0
 
@@ -76,186 +822,290 @@ class ImageConverter(object):
             if retry > 5:
                 return
 
-    def convert_png_to_jpg_rgb(self, tex_path):
-        tex_basename = os.path.splitext(tex_path)[0]
-        img = PNMImage()
-        self.load_img_with_retry(img, tex_path)
+    def prepare_png_to_jpg_rgb(self, tex_path, wipe=False):
+        """
+        Returns the job converting a PNG file to a JPG file, and a RGB file if it has an alpha channel.
+            :tex_path: The path of the PNG file.
+            :wipe: Should the PNG file be removed once it has been converted?
+        """
+        if self.is_cached('jpg', tex_path, [tex_path]):
+            return
 
-        jpg_path = tex_basename + '.jpg'
+        return ImageJob('jpg', tex_path, [tex_path], [tex_path] if wipe else [], stamps=self.get_input_stamps([tex_path]))
 
+    def process_jpg(self, job):
+        tex_path = job.inputs[0]
+        tex_basename = os.path.splitext(tex_path)[0]
+
+        img = self.get_job_image(job, tex_path, writable=True)
         x_size = img.get_x_size()
         y_size = img.get_y_size()
-        output_img = PNMImage(x_size, y_size, 3)
-        output_img.copy_sub_image(img, 0, 0, 0, 0, x_size, y_size)
+        alpha_image = None
+
+        if img.num_channels == 4 and self.analyze_alpha and self.get_alpha_type(tex_path, img) == ALPHA_OPAQUE:
+            print(f'Alpha of {tex_path} is fully opaque, skipping its RGB file')
+        elif img.num_channels == 4:
+            with self.profiler.stage('alpha_split', tex_path) as stage:
+                # Copy alpha channel from source image before we drop it
+                alpha_image = PNMImage(x_size, y_size, 1)
+                alpha_image.set_type(RGB_TYPE)
+                alpha_image.copy_channel(img, ALPHA_CHANNEL, GRAY_CHANNEL)
+                stage.add_pixels(img)
+
+        # Write the JPG straight from the source image, there's no need for a separate copy.
+        # This also expands grayscale images to all three color channels.
+        img.set_color_type(3)
+
+        if img.get_maxval() != 255:
+            # JPG files are always 8-bit, so deeper images still need to be scaled down.
+            jpg_img = PNMImage(x_size, y_size, 3)
+            jpg_img.copy_sub_image(img, 0, 0, 0, 0, x_size, y_size)
+        else:
+            jpg_img = img
 
         jpg_path = tex_basename + '.jpg'
 
         print(f'Writing JPG {jpg_path}...')
-        output_img.write(Filename.from_os_specific(jpg_path))
-
-        if img.num_channels == 4:
-            alpha_image = PNMImage(x_size, y_size, 1)
-            alpha_image.set_type(RGB_TYPE)
-
-            # Copy alpha channel from source image
-            for i in range(x_size):
-                for j in range(y_size):
-                    alpha_image.set_gray(i, j, img.get_alpha(i, j))
+        job.outputs = [(jpg_path, jpg_img)]
 
+        if alpha_image is not None:
             rgb_path = tex_basename + '_a.rgb'
 
             print(f'Writing RGB {rgb_path}...')
-            alpha_image.write(Filename.from_os_specific(rgb_path))
+            job.outputs.append((rgb_path, alpha_image))
 
-    def convert_all_png_to_jpg_rgb(self):
-        to_wipe = []
+        return job
+
+    def convert_png_to_jpg_rgb(self, tex_path, wipe=False):
+        self.run_job(self.prepare_png_to_jpg_rgb(tex_path, wipe))
+
+    def convert_all_png_to_jpg_rgb(self, wipe=False, changed=None):
+        """
+        Converts every PNG file in the model path to JPG+RGB.
+            :wipe: Should the PNG files be removed once they have been converted?
+            :changed: If given, only PNG files in this set of normalized paths are converted.
+        """
+        for full_path in self.iter_files(self.model_path):
+            if not full_path.lower().endswith('.png'):
+                continue
 
-        for root, _, files in os.walk(self.model_path):
-            for file in files:
-                full_path = os.path.join(root, file)
+            if changed is not None and os.path.normcase(full_path) not in changed:
+                continue
 
-                if not full_path.lower().endswith('.png'):
-                    continue
+            self.submit_job('convert_png_to_jpg_rgb', full_path, wipe)
 
-                self.convert_png_to_jpg_rgb(full_path)
-                to_wipe.append(full_path)
+        self.collect_jobs()
 
-        return to_wipe
+    def resolve_texture_path(self, tex_path, model_path=None):
+        """
+        Turns a texture path found in a model into an OS specific path.
+            :tex_path: The texture path, relative to the model path or the model itself.
+            :model_path: The path of the model referencing this texture, if any.
+        """
+        return resolve_texture_path(tex_path, self.model_path, model_path)
 
-    def convert_texture(self, texture, model_path=None):
+    def prepare_texture(self, texture, model_path=None):
+        """
+        Returns the job converting a JPG or RGB texture, or a JPG+RGB combo, to a PNG file.
+            :texture: The texture transformation, as returned by switch_texture_mode.
+            :model_path: The path of the model referencing this texture, if any.
+        """
         if not self.model_path:
             self.print_exc('ERROR: No model path specified in ImageConverter.')
             return
 
-        tex_path = texture[0]
-        tex_basename = os.path.splitext(os.path.basename(tex_path))[0]
-
-        if not os.path.isabs(tex_path):
-            if '../' in tex_path and model_path:
-                # This texture path is using relative paths.
-                # We assume that the working directory is the model's directory
-                tex_path = os.path.join(os.path.dirname(model_path), tex_path)
-            else:
-                tex_path = os.path.join(self.model_path, tex_path)
+        tex_path = self.resolve_texture_path(texture[0], model_path)
+        found_path = self.find_path(tex_path)
 
-        tex_path = tex_path.replace('\\', os.sep).replace('/', os.sep)
-
-        if not os.path.exists(tex_path):
+        if not found_path:
             self.print_exc('ERROR: Could not convert {}: Missing RGB texture!'.format(tex_path))
             return
 
-        png_tex_path = os.path.join(os.path.dirname(tex_path), tex_basename + '.png')
-        png_tex_path = png_tex_path.replace('\\', os.sep).replace('/', os.sep)
-
-        print('Converting to PNG...', png_tex_path)
+        tex_path = found_path
+        tex_basename = os.path.splitext(os.path.basename(tex_path))[0]
 
-        if len(texture) == 1:
-            # Only one texture, we can save this immediately
-            if tex_path.lower().endswith('.rgb'):
-                output_img = PNMImage()
-                output_img.read(Filename.from_os_specific(tex_path))
+        inputs = [tex_path]
 
-                if output_img.num_channels in (1, 2) and 'golf_ball' not in tex_path and 'roll-o-dex' not in tex_path: # HACK: Toontown
-                    output_img.set_color_type(4)
+        if len(texture) == 2:
+            # Two textures: the second one should be a RGB file
+            alpha_path = self.resolve_texture_path(texture[1], model_path)
+            found_path = self.find_path(alpha_path)
 
-                    for i in range(output_img.get_x_size()):
-                        for j in range(output_img.get_y_size()):
-                            output_img.set_alpha(i, j, output_img.get_gray(i, j))
-            else:
-                output_img = self.read_texture(tex_path, alpha=False)
-        elif len(texture) == 2:
-            img = self.read_texture(tex_path, alpha=True)
+            if not found_path:
+                self.print_exc('ERROR: Could not convert {} with alpha {}: Missing alpha texture!'.format(tex_path, alpha_path))
+                return
 
-            # Two textures: the second one should be a RGB file
-            alpha_path = texture[1]
+            alpha_path = found_path
 
-            if not os.path.isabs(alpha_path):
-                if '../' in alpha_path and model_path:
-                    # This texture path is using relative paths.
-                    # We assume that the working directory is the model's directory
-                    alpha_path = os.path.join(os.path.dirname(model_path), alpha_path)
-                else:
-                    alpha_path = os.path.join(self.model_path, alpha_path)
+            inputs.append(alpha_path)
 
-            alpha_path = alpha_path.replace('\\', os.sep).replace('/', os.sep)
+        png_tex_path = os.path.join(os.path.dirname(tex_path), tex_basename + '.png')
 
-            if not os.path.exists(alpha_path):
-                self.print_exc('ERROR: Could not convert {} with alpha {}: Missing alpha texture!'.format(tex_path, alpha_path))
-                return
+        if self.is_cached('png', png_tex_path, inputs):
+            return
 
-            alpha_img = PNMImage()
-            alpha_img.read(Filename.from_os_specific(alpha_path))
+        print('Converting to PNG...', png_tex_path)
+        return ImageJob('png', png_tex_path, inputs, stamps=self.get_input_stamps(inputs))
 
-            alpha_img = self.resize_image(alpha_img, img.get_x_size(), img.get_y_size())
+    def process_png(self, job):
+        tex_path = job.inputs[0]
 
-            output_img = PNMImage(img.get_x_size(), img.get_y_size(), 4)
-            output_img.alpha_fill(1)
+        if len(job.inputs) == 1:
+            # Only one texture, we can save this immediately
+            if tex_path.lower().endswith('.rgb'):
+                output_img = self.get_job_image(job, tex_path, writable=True)
+
+                # Grayscale RGB files with transparency, such as font palettes, already have a proper alpha channel.
+                if output_img.num_channels == 1 and not self.is_gray_only(tex_path): # HACK: Toontown
+                    with self.profiler.stage('alpha_merge', tex_path) as stage:
+                        output_img.set_color_type(4)
+                        output_img = self.copy_gray_to_alpha(output_img, output_img)
+                        stage.add_pixels(output_img)
+            else:
+                output_img = self.set_texture_alpha(self.get_job_image(job, tex_path, writable=True), alpha=False)
+        elif self.analyze_alpha and self.get_alpha_type(job.inputs[1], job.images[job.inputs[1]], gray=True) == ALPHA_OPAQUE:
+            # The alpha texture is fully opaque, so the PNG does not need an alpha channel at all.
+            print(f'Alpha of {job.inputs[1]} is fully opaque, writing {job.path} without alpha')
+            output_img = self.set_texture_alpha(self.get_job_image(job, tex_path, writable=True), alpha=False)
+        else:
+            alpha_path = job.inputs[1]
+            img = self.set_texture_alpha(self.get_job_image(job, tex_path, writable=True), alpha=True)
+            alpha_img = self.resize_alpha(alpha_path, job.images[alpha_path], img.get_x_size(), img.get_y_size())
 
-            output_img.copy_sub_image(img, 0, 0, 0, 0, img.get_x_size(), img.get_y_size())
+            with self.profiler.stage('alpha_merge', tex_path) as stage:
+                # Combined textures have always been written with 8 bits per channel, whatever their inputs.
+                output_img = self.copy_gray_to_alpha(img, alpha_img, maxval=255)
+                stage.add_pixels(output_img)
 
-            for i in range(img.get_x_size()):
-                for j in range(img.get_y_size()):
-                    output_img.set_alpha(i, j, alpha_img.get_gray(i, j))
+        job.outputs = [(job.path, output_img)]
+        return job
 
-        output_img.write(Filename.from_os_specific(png_tex_path))
+    def convert_texture(self, texture, model_path=None):
+        self.run_job(self.prepare_texture(texture, model_path))
 
     def find_file(self, search_path):
         for filename in search_path:
-            if os.path.exists(filename):
-                return filename
+            found_path = self.find_path(filename)
+
+            if found_path:
+                return found_path
 
-    def convert_all(self, phase_files):
+    def convert_all(self, phase_files, changed=None):
+        """
+        Converts every JPG file in the model path to PNG, along with its RGB file.
+        Returns the input files of every conversion.
+            :phase_files: The phase files folder, also searched for RGB files.
+            :changed: If given, only JPG files whose JPG or RGB file is in this set of normalized paths are converted.
+        """
         to_wipe = []
 
-        for root, _, files in os.walk(self.model_path):
-            for file in files:
-                full_path = os.path.relpath(os.path.join(root, file), self.model_path)
+        if self.file_index is not None:
+            self.file_index.add_folder(phase_files)
 
-                if not full_path.lower().endswith('.jpg'):
-                    continue
+        for full_path in self.iter_files(self.model_path):
+            full_path = os.path.relpath(full_path, self.model_path)
 
-                filename_wo_ext = os.path.splitext(full_path)[0]
-                rgb_order = [
-                    os.path.join(self.model_path, filename_wo_ext + '_a.rgb'),
-                    os.path.join(self.model_path, filename_wo_ext + '.rgb'),
-                    os.path.join(phase_files, filename_wo_ext + '_a.rgb'),
-                    os.path.join(phase_files, filename_wo_ext + '.rgb')
-                ]
-                rgb = self.find_file(rgb_order)
+            if not full_path.lower().endswith('.jpg'):
+                continue
 
-                if rgb:
-                    input_files = [full_path, rgb]
-                else:
-                    input_files = [full_path]
+            filename_wo_ext = os.path.splitext(full_path)[0]
+            rgb_order = [
+                os.path.join(self.model_path, filename_wo_ext + '_a.rgb'),
+                os.path.join(self.model_path, filename_wo_ext + '.rgb'),
+                os.path.join(phase_files, filename_wo_ext + '_a.rgb'),
+                os.path.join(phase_files, filename_wo_ext + '.rgb')
+            ]
+
+            if changed is not None and changed.isdisjoint(os.path.normcase(path) for path in [os.path.join(self.model_path, full_path)] + rgb_order):
+                continue
+
+            rgb = self.find_file(rgb_order)
+
+            if rgb:
+                input_files = [full_path, rgb]
+            else:
+                input_files = [full_path]
 
-                self.convert_texture(input_files)
-                to_wipe.append(input_files)
+            self.submit_job('convert_texture', input_files)
+            to_wipe.append(input_files)
 
+        self.collect_jobs()
         return to_wipe
 
+    def get_texture_key(self, texture, model_path=None):
+        """
+        Returns a hashable key identifying the files used by a texture.
+        Different spellings of the same path result in the same key.
+            :texture: The texture transformation, as returned by switch_texture_mode.
+            :model_path: The path of the model referencing this texture, if any.
+        """
+        return tuple(os.path.normcase(self.resolve_texture_path(path, model_path)) for path in texture)
+
     def convert_textures(self, textures, model_path=None):
         for texture in textures:
-            if texture in self.converted_so_far:
+            key = self.get_texture_key(texture, model_path)
+
+            if key in self.converted_so_far:
                 # We've already converted this texture...!!!
                 # Don't do the same work twice.
                 continue
 
-            self.convert_texture(texture, model_path)
-            self.converted_so_far.append(texture)
+            self.converted_so_far.add(key)
+
+            # Textures converted by a previous run are skipped before their JPG and RGB files are looked up,
+            # since --wipe-jpg might have removed them.
+            png_path = os.path.splitext(self.resolve_texture_path(texture[0], model_path))[0] + '.png'
+
+            if not self.is_converted('png', png_path, len(texture)):
+                self.submit_job('convert_texture', texture, model_path)
+
+    def convert_index(self, index):
+        """
+        Converts every unique texture in a TextureIndex.
+            :index: The TextureIndex to convert.
+        """
+        for texture, model_path in index.get_textures():
+            self.convert_textures([texture], model_path)
+
+    def forget_files(self, paths):
+        """
+        Forgets the decoded images and converted textures of files that have changed on disk,
+        so that the textures using them are converted again.
+            :paths: The paths of the changed files.
+        """
+        paths = set(os.path.normcase(os.path.abspath(path)) for path in paths)
+
+        for path in paths:
+            self.image_cache.remove(path)
+
+        self.dedup.forget_files(paths)
+        self.alpha_types = {key: alpha_type for key, alpha_type in self.alpha_types.items() if key[0] not in paths}
+        self.converted_so_far = set(key for key in self.converted_so_far if paths.isdisjoint(key))
 
     def wipe_texture(self, folder, texture):
-        jpg = os.path.join(folder, texture[0])
+        jpg = self.find_path(os.path.join(folder, texture[0]))
 
-        if os.path.exists(jpg):
+        if jpg:
             print('Removing old JPG', jpg + '...')
-            os.remove(jpg)
+            self.remove_file(jpg)
 
         if len(texture) > 1:
-            rgb = os.path.join(folder, texture[1])
+            rgb = self.find_path(os.path.join(folder, texture[1]))
 
-            if os.path.exists(rgb):
+            if rgb:
                 print('Removing old RGB', rgb + '...')
-                os.remove(rgb)
+                self.remove_file(rgb)
+
+    def remove_file(self, path):
+        with self.profiler.stage('remove', path):
+            if self.is_archived(path):
+                self.archives.remove(path)
+                return
+
+            os.remove(path)
+
+        if self.file_index is not None:
+            self.file_index.discard(path)
 
     def wipe_textures(self, folder, textures):
         for texture in textures:
@@ -0,0 +1,38 @@
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+# The image options accepted on the command line.
+# This module must stay free of Panda3D and NumPy, so that runs which only rewrite models never load them.
+
+# The filters that can be used to resize alpha textures that don't match their JPG.
+RESIZE_FILTERS = ('nearest', 'box', 'bilinear', 'gaussian')
+
+# Named zlib compression levels, for quick iteration builds and small release packs.
+PNG_COMPRESSION_LEVELS = {'fast': 1, 'default': 6, 'max': 9}
+
+# 'default' leaves the filtering to Panda3D's own PNG writer.
+# The others are applied by our own encoder. 'adaptive' picks the best filter for every row.
+PNG_FILTERS = ('default', 'none', 'sub', 'up', 'average', 'paeth', 'adaptive')
+
+# How the outputs of images with identical inputs are shared: not at all, copied, or hardlinked.
+DEDUP_MODES = ('off', 'copy', 'link')
+
+def get_compression_level(compression):
+    """
+    Returns the zlib compression level of a --png-compression value.
+        :compression: 'fast', 'default', 'max' or a level between 0 and 9.
+    """
+    if compression in PNG_COMPRESSION_LEVELS:
+        return PNG_COMPRESSION_LEVELS[compression]
+
+    level = int(compression)
+
+    if not 0 <= level <= 9:
+        raise ValueError(f'Invalid PNG compression level: {compression}')
+
+    return level
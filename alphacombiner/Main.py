@@ -1,9 +1,17 @@
 from p3bamboo.BamGlobals import BAMException
 from p3bamboo.BamFactory import BamFactory
+from .BuildCache import BuildCache
 from .CombinerBamFile import CombinerBamFile
-from .ImageConverter import ImageConverter
+from .FileDiscovery import FileFilter, find_paths, is_png_output, scan_files
+from .FileIndex import FileIndex
+from .ImageOptions import DEDUP_MODES, PNG_COMPRESSION_LEVELS, PNG_FILTERS, RESIZE_FILTERS, get_compression_level
+from .Profiler import Profiler
+from .MultifileStore import MultifileStore, is_multifile
 from .Texture import Texture
-import argparse, glob, os
+from .TextureIndex import TextureIndex, resolve_texture_path
+from .Watcher import Watcher
+from collections import deque
+import argparse, contextlib, io, os, sys, traceback
 
 """
   TOONTOWN ALPHA COMBINER
@@ -19,145 +27,666 @@ def print_enabled(flag, description):
     else:
         print(f'NOT {description[0].lower() + description[1:]}.')
 
-def convert_pack(args, folder):
-    if not os.path.exists(folder) or not os.path.isdir(folder):
+def make_converter(args, folder, cache=None, file_index=None, profiler=None, archives=None):
+    # Panda3D's image stack and NumPy are slow to import, so they're only loaded once images are needed.
+    from .ImageConverter import ImageConverter
+    return ImageConverter(folder, args.early_exit, args.jobs, cache, file_index, profiler, args.resize_filter, args.image_cache_mb, args.pipeline, args.queue_size, get_compression_level(args.png_compression), args.png_filter, archives, args.dedup, args.analyze_alpha, make_file_filter(args))
+
+def convert_pack(args, folder, cache=None, file_index=None, profiler=None, archives=None, converter=None, changed=None):
+    if not os.path.isdir(folder) and not is_multifile(folder):
         print(f'Folder {folder} does not exist!')
 
-    converter = ImageConverter(folder, args.early_exit)
-    to_wipe = converter.convert_all(args.phase_files)
+    converter = converter or make_converter(args, folder, cache, file_index, profiler, archives)
+    to_wipe = converter.convert_all(args.phase_files, changed)
+    converter.shutdown()
+    converter.image_cache.print_stats()
+    converter.dedup.print_stats()
 
     if args.wipe_jpg:
         converter.wipe_textures(folder, to_wipe)
 
-def convert_to_jpg(args, folder):
-    if not os.path.exists(folder) or not os.path.isdir(folder):
+    return converter
+
+def convert_to_jpg(args, folder, cache=None, file_index=None, profiler=None, archives=None, converter=None, changed=None):
+    if not os.path.isdir(folder) and not is_multifile(folder):
         print(f'Folder {folder} does not exist!')
 
-    converter = ImageConverter(folder, args.early_exit)
-    to_wipe = converter.convert_all_png_to_jpg_rgb()
+    converter = converter or make_converter(args, folder, cache, file_index, profiler, archives)
+    # The PNG files are removed as soon as they have been converted.
+    converter.convert_all_png_to_jpg_rgb(args.wipe_jpg, changed)
+    converter.shutdown()
+    converter.image_cache.print_stats()
+    converter.dedup.print_stats()
+    return converter
+
+def main_pack(args, cache=None, file_index=None, profiler=None, archives=None, converters=None, changed=None):
+    """
+    Converts every content pack. Returns the converter of each pack, so that --watch can reuse them.
+        :converters: The converters of a previous run, if any.
+        :changed: If given, only images in this set of normalized paths are converted.
+    """
+    converters = {} if converters is None else converters
 
-    if args.wipe_jpg:
-        converter.wipe_textures(folder, to_wipe)
-
-def main_pack(args):
     for folder in args.filenames:
-        convert_pack(args, os.path.abspath(folder))
+        folder = os.path.abspath(folder)
+        converters[folder] = convert_pack(args, folder, cache, file_index, profiler, archives, converters.get(folder), changed)
 
     print('Done.')
+    return converters
+
+def main_jpg(args, cache=None, file_index=None, profiler=None, archives=None, converters=None, changed=None):
+    """
+    Converts every PNG folder. Returns the converter of each folder, so that --watch can reuse them.
+        :converters: The converters of a previous run, if any.
+        :changed: If given, only images in this set of normalized paths are converted.
+    """
+    converters = {} if converters is None else converters
 
-def main_jpg(args):
     for folder in args.filenames:
-        convert_to_jpg(args, os.path.abspath(folder))
+        folder = os.path.abspath(folder)
+        converters[folder] = convert_to_jpg(args, folder, cache, file_index, profiler, archives, converters.get(folder), changed)
 
     print('Done.')
+    return converters
+
+def print_peak_memory(args):
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows.
+        return
+
+    # ru_maxrss is measured in kilobytes on Linux, but in bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+
+    print(f'Peak memory usage: {peak / 1048576:.1f} MB')
+
+    # Images are converted on threads in pipeline mode, but models are still rewritten by worker processes.
+    uses_workers = not args.pipeline or not (args.convert_pack or args.convert_to_jpg)
+
+    if args.jobs != 1 and uses_workers:
+        print(f'Peak memory usage of a worker process: {peak_children / 1048576:.1f} MB')
 
 def setup_p3bamboo():
-    BamFactory.register_type('Texture', Texture)
+    if 'Texture' not in BamFactory.types:
+        BamFactory.register_type('Texture', Texture)
+
+def find_models(filenames, archives=None, file_filter=None):
+    """
+    Yields the absolute path of every model to rewrite, as soon as it is found.
+        :filenames: Model paths, folders or Multifiles. Accepts *, ? and [] as wildcards, and ** for any number of folders.
+        :archives: An optional MultifileStore. Every model inside a Multifile is rewritten.
+        :file_filter: An optional FileFilter, with the --include and --exclude patterns.
+    """
+    for filename in filenames:
+        for file in find_paths(filename):
+            yield from find_model_files(file, archives, file_filter)
+
+def find_model_files(file, archives=None, file_filter=None):
+    """
+    Yields the models found at a single path: the model itself, or every model inside a folder or Multifile.
+    """
+    if is_png_output(file):
+        # This is one of our converted _png BAM files or Multifiles
+        return
 
-def main():
-    setup_p3bamboo()
+    if archives is not None and is_multifile(file):
+        # Every model inside a Multifile is rewritten.
+        for path in archives.iter_files(file):
+            if path.lower().endswith('.bam'):
+                yield from find_model_files(path, file_filter=file_filter)
 
-    parser = argparse.ArgumentParser(description='This script can be used to convert Panda3D bam models using JPG+RGB textures to use PNG textures.')
-    parser.add_argument('--jpg', '-j', action='store_true', help='Convert regular JPG textures to PNG textures.')
-    parser.add_argument('--rgb', '-r', action='store_true', help='Convert JPG+RGB texture combos to PNG textures.')
-    parser.add_argument('--overwrite', '-o', action='store_true', help='Overwrite models instead of appending _png to the filename.')
-    parser.add_argument('--convert-images', '-c', action='store_true', help='Convert all modified images to PNG in-place.')
-    parser.add_argument('--wipe-jpg', '-w', action='store_true', help='Remove all JPG+RGB files that have been converted to PNG.')
-    parser.add_argument('--early-exit', '-e', action='store_true', help='Exit immediately if an image could not be converted properly.')
-    parser.add_argument('--convert-relative', '-l', action='store_true', help='Convert all relative paths to absolute paths in models.')
-    parser.add_argument('--phase-files', '-p', help='The location of your phase files. Required for --convert-images.')
-    parser.add_argument('--convert-pack', '-b', action='store_true', help='Convert all images inside this directory.')
-    parser.add_argument('--convert-to-jpg', '-z', action='store_true', help='Convert all PNG images to JPG+RGB in-place.')
-    parser.add_argument('filenames', nargs='+', help='The raw input file(s). Accepts * as wildcard.')
-    args = parser.parse_args()
+        return
 
-    if args.phase_files:
-        args.phase_files = os.path.abspath(args.phase_files)
+    if os.path.isdir(file):
+        # Every model inside a folder is rewritten, including its subfolders.
+        for path in scan_files(file, '.bam'):
+            yield from find_model_files(path, archives, file_filter)
 
-    if args.convert_to_jpg:
-        main_jpg(args)
         return
 
-    if (args.convert_images or args.wipe_jpg or args.convert_relative or args.convert_pack):
-        if not args.phase_files:
-            parser.print_help()
-            print('You must specify your phase files folder!')
+    file = os.path.abspath(file)
+
+    if file_filter is None or file_filter.accepts(file):
+        yield file
+
+def make_file_filter(args):
+    return FileFilter(args.include, args.exclude)
+
+# Analyzes the alpha textures of rewritten models, once per process.
+alpha_analyzer = None
+
+def get_alpha_analyzer():
+    global alpha_analyzer
+
+    if alpha_analyzer is None:
+        # The analysis needs NumPy, which is only loaded once alpha textures are analyzed.
+        from .AlphaAnalysis import AlphaAnalyzer
+        alpha_analyzer = AlphaAnalyzer()
+
+    return alpha_analyzer
+
+def rewrite_model(args, file, profiler=None, archives=None):
+    """
+    Switches the texture mode of a single BAM file, and writes it if it has been modified.
+    Returns the target filename, texture transformations and whether the BAM was written,
+    or None if this is not a BAM file.
+        :args: The parsed command line arguments.
+        :file: The absolute path of the BAM file.
+        :profiler: An optional Profiler.
+        :archives: An optional MultifileStore, for models inside Multifiles.
+    """
+    profiler = profiler or Profiler()
+    basename, ext = os.path.splitext(os.path.basename(file))
+    bam = CombinerBamFile(profiler)
+    archived = archives is not None and archives.contains(file)
+
+    if args.overwrite or archived:
+        # Models inside Multifiles are written into a new Multifile, so they keep their name.
+        target_filename = file
+    else:
+        target_filename = os.path.join(os.path.dirname(file), basename + '_png' + ext)
+
+    with (io.BytesIO(archives.read(file)) if archived else open(file, 'rb')) as f, profiler.stage('bam_load', file) as stage:
+        print(f'Loading {file}...')
+        # Relative texture paths are resolved as if the Multifile was mounted.
+        bam.set_filename(archives.get_mount_path(file) if archived else file)
+
+        if archived:
+            stage.add_read_size(len(f.getbuffer()))
+        else:
+            stage.add_read(file)
+
+        try:
+            if args.fast_rewrite or args.mmap:
+                data = bam.map_file(f) if args.mmap and not archived else f.read()
+
+                if data[:len(bam.HEADER)] != bam.HEADER:
+                    raise BAMException('Invalid BAM header.')
+
+                if not bam.might_switch_texture_mode(data, args.jpg, args.rgb, args.convert_relative):
+                    print(f'{file} does not reference any RGB textures, skipping...')
+                    bam.close()
+                    return target_filename, [], False
+
+                bam.load_lazy(data)
+            else:
+                bam.load(f)
+        except BAMException:
+            print(f'{file} is not a BAM file, skipping...')
+            bam.close()
             return
-        if not os.path.exists(args.phase_files):
-            parser.print_help()
-            print('This phase files folder does not exist!')
+
+    get_num_channels = None
+
+    if args.analyze_alpha and args.phase_files:
+        # Textures whose alpha texture is fully opaque only need the three color channels of their PNG.
+        analyzer = get_alpha_analyzer()
+        model_path = bam.get_filename()
+        get_num_channels = lambda transformation: analyzer.get_num_channels(transformation, args.phase_files, model_path, archives)
+
+    textures, modified = bam.switch_texture_mode(args.jpg, args.rgb, args.convert_relative, args.phase_files, get_num_channels)
+
+    if modified and not args.scan_only:
+        print('Writing', target_filename + '...')
+        write_model(args, bam, target_filename, profiler, archives if archived else None)
+
+    bam.close()
+
+    # If we haven't changed any textures, there's no reason to rewrite the BAM.
+    return target_filename, textures, modified
+
+def write_model(args, bam, target_filename, profiler, archives=None):
+    with profiler.stage('bam_write', target_filename) as stage:
+        if archives is not None:
+            with io.BytesIO() as f:
+                if args.fast_rewrite or args.mmap:
+                    bam.write_lazy(f)
+                else:
+                    bam.write(f)
+
+                archives.write(target_filename, f.getvalue())
+                stage.add_written_size(f.tell())
+
             return
 
-    if args.convert_pack:
-        main_pack(args)
+        if args.mmap:
+            # The model might still be mapped into memory, so we can't write over it directly.
+            temp_filename = target_filename + '.tmp'
+
+            with open(temp_filename, 'wb') as f:
+                bam.write_lazy(f)
+
+            bam.close()
+            os.replace(temp_filename, target_filename)
+        else:
+            with open(target_filename, 'wb') as f:
+                if args.fast_rewrite:
+                    bam.write_lazy(f)
+                else:
+                    bam.write(f)
+
+        stage.add_written(target_filename)
+
+# The Multifiles, as seen by a model worker process.
+worker_archives = None
+
+def init_model_worker(archives):
+    global worker_archives
+    setup_p3bamboo()
+    worker_archives = archives
+
+def run_model_worker(args, file):
+    """
+    Rewrites a BAM file inside a worker process.
+    Output is captured, so that the parent process can print it in a stable order.
+    """
+    output = io.StringIO()
+    profiler = Profiler(bool(args.profile))
+    result = None
+    error = None
+
+    with contextlib.redirect_stdout(output):
+        try:
+            result = rewrite_model(args, file, profiler, worker_archives)
+        except Exception as e:
+            error = e
+
+    # Models written into Multifiles are saved by the parent process.
+    archive_changes = worker_archives.pop_changes() if worker_archives is not None else None
+    return output.getvalue(), result, error, profiler.pop_records(), archive_changes
+
+def get_model_flags(args):
+    """
+    Returns every option that affects the rewritten BAM files.
+    """
+    return {
+        'jpg': args.jpg,
+        'rgb': args.rgb,
+        'overwrite': args.overwrite,
+        'convert_relative': args.convert_relative,
+        'phase_files': args.phase_files,
+        'fast_rewrite': args.fast_rewrite or args.mmap,
+        'analyze_alpha': args.analyze_alpha
+    }
+
+def get_model_inputs(args, file, result):
+    """
+    Returns the input files of a rewritten model: the model itself, and the alpha textures
+    that decided the channel counts of its textures when alpha textures are analyzed.
+        :file: The path of the BAM file.
+        :result: The target filename and texture transformations of the model, or None.
+    """
+    inputs = [file]
+
+    if not args.analyze_alpha or not args.phase_files or result is None:
+        return inputs
+
+    target_filename, textures = result
+
+    for texture in textures:
+        if len(texture) != 2 or not texture[1].lower().endswith('.rgb'):
+            continue
+
+        alpha_path = resolve_texture_path(texture[1], args.phase_files, target_filename)
+
+        if os.path.isfile(alpha_path) and alpha_path not in inputs:
+            inputs.append(alpha_path)
+
+    return inputs
+
+def finish_model(args, cache, file, result, stamps=None):
+    """
+    Remembers a rewritten model in the build cache, unless we are only scanning models.
+    Returns the target filename and texture transformations, or None if this is not a BAM file.
+        :stamps: The stamp of the model file, taken before it was read.
+    """
+    if result is not None:
+        target_filename, textures, modified = result
+        result = [target_filename, textures]
+        outputs = [target_filename] if modified else []
+    else:
+        outputs = []
+
+    if cache is not None and not args.scan_only:
+        cache.update(f'bam:{file}', get_model_inputs(args, file, result), outputs, get_model_flags(args), result, stamps)
+
+    return result
+
+def rewrite_models(args, files, cache=None, profiler=None, archives=None):
+    """
+    Rewrites BAM files, either one by one or spread across a process pool.
+    Models that are up to date in the build cache are skipped.
+    Yields each model together with its target filename and texture transformations, in the order the files were given.
+        :args: The parsed command line arguments.
+        :files: An iterable of absolute BAM paths.
+        :cache: An optional BuildCache.
+        :profiler: An optional Profiler.
+        :archives: An optional MultifileStore, for models inside Multifiles.
+    """
+    profiler = profiler or Profiler()
+    flags = get_model_flags(args)
+
+    def is_cached(file):
+        if cache is None or not cache.is_up_to_date(f'bam:{file}', get_model_inputs(args, file, cache.get_result(f'bam:{file}')), flags):
+            return False
+
+        print(f'{file} is already up to date, skipping...')
+        return True
+
+    def get_stamps(file):
+        return cache.get_stamps([file]) if cache is not None else None
+
+    if args.jobs == 1:
+        for file in files:
+            if is_cached(file):
+                yield file, cache.get_result(f'bam:{file}')
+            else:
+                stamps = get_stamps(file)
+                yield file, finish_model(args, cache, file, rewrite_model(args, file, profiler, archives), stamps)
+
         return
 
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(args.jobs or None, initializer=init_model_worker, initargs=(archives,)) as executor:
+        # Models are submitted as soon as they are found, and handed on as soon as they are done,
+        # so that a huge tree of models is never queued up all at once.
+        max_pending = (args.jobs or os.cpu_count()) * 4
+        futures = deque()
+
+        def get_result(file, future, stamps):
+            if future is None:
+                return cache.get_result(f'bam:{file}')
+
+            output, result, error, profile_records, archive_changes = future.result()
+            print(output, end='')
+            profiler.merge(profile_records)
+
+            if archive_changes:
+                archives.merge(archive_changes)
+
+            if error is not None:
+                raise error
+
+            return finish_model(args, cache, file, result, stamps)
+
+        def is_ready():
+            return futures and (len(futures) > max_pending or futures[0][1] is None or futures[0][1].done())
+
+        try:
+            for file in files:
+                if is_cached(file):
+                    futures.append((file, None, None))
+                else:
+                    stamps = get_stamps(file)
+                    futures.append((file, executor.submit(run_model_worker, args, file), stamps))
+
+                while is_ready():
+                    file, future, stamps = futures.popleft()
+                    yield file, get_result(file, future, stamps)
+
+            while futures:
+                file, future, stamps = futures.popleft()
+                yield file, get_result(file, future, stamps)
+        finally:
+            for _, future, _ in futures:
+                if future is not None:
+                    future.cancel()
+
+def main_models(args, cache=None, file_index=None, profiler=None, archives=None):
     print_enabled(args.jpg, 'Converting regular JPG textures to PNG textures')
     print_enabled(args.rgb, 'Converting JPG + RGB texture combos to PNG textures')
     print_enabled(args.overwrite, 'Overwriting files in place')
     print_enabled(args.convert_images, 'Converting images to PNG in place')
     print_enabled(args.convert_images and args.wipe_jpg, 'Wiping old JPG images')
     print_enabled(args.convert_relative, 'Converting relative paths')
+    print_enabled(args.analyze_alpha, 'Analyzing alpha textures')
+
+    # Models are rewritten without ever touching a pixel, unless images are converted or indexed.
+    converter = make_converter(args, args.phase_files, cache, file_index, profiler, archives) if args.convert_images or args.dump_index else None
+    index = TextureIndex()
+
+    if file_index is not None:
+        file_index.add_folder(args.phase_files)
+
+    convert_models(args, converter, index, find_models(args.filenames, archives, make_file_filter(args)), cache, profiler, archives)
+    return {args.phase_files: converter} if converter is not None else {}, index
+
+def convert_models(args, converter, index, files, cache=None, profiler=None, archives=None):
+    """
+    Rewrites models, and converts the textures they use.
+    Textures this converter has already converted are skipped, so that --watch only converts new and changed textures.
+    Returns the target filename and texture transformations of every model, by model path.
+        :converter: The ImageConverter of the phase files, or None if no images are converted or indexed.
+        :index: The TextureIndex the textures of the models are added to.
+        :files: An iterable of absolute BAM paths.
+    """
+    to_wipe = {}
+    models = {}
+
+    # First pass: rewrite all models, and find out which textures they use.
+    for file, result in rewrite_models(args, files, cache, profiler, archives):
+        if result is None:
+            continue
+
+        target_filename, textures = models[file] = result
+
+        if args.convert_images or args.dump_index:
+            for texture in textures:
+                index.add(converter.get_texture_key(texture, target_filename), texture, target_filename, file)
+
+        if args.convert_images and args.wipe_jpg:
+            for texture in textures:
+                to_wipe[tuple(texture)] = texture
+
+    if args.dump_index:
+        index.dump(args.dump_index, args.phase_files, converter)
+
+    if args.scan_only or converter is None:
+        print('Done.')
+        return models
+
+    # Second pass: convert every unique texture exactly once.
+    if args.convert_images:
+        converter.convert_index(index)
+
+    # Wait for all images to finish converting before wiping anything
+    converter.collect_jobs()
+    converter.shutdown()
+    converter.image_cache.print_stats()
+    converter.dedup.print_stats()
 
-    converter = ImageConverter(args.phase_files, args.early_exit)
-    to_wipe = []
+    if args.wipe_jpg:
+        converter.wipe_textures(args.phase_files, to_wipe.values())
 
-    for filename in args.filenames:
-        files = []
+    print('Done.')
+    return models
 
-        if '*' in filename:
-            files = glob.glob(filename)
-        else:
-            files.append(filename)
+def make_watcher(args):
+    """
+    Returns a Watcher watching the input files of the current mode.
+    Our own output files are never watched, so that they don't trigger another run.
+    """
+    watcher = Watcher(args.watch_interval, args.watch_debounce)
 
-        for file in files:
-            file = os.path.abspath(file)
-            basename, ext = os.path.splitext(os.path.basename(file))
+    if args.convert_to_jpg:
+        watcher.add(args.filenames, ['.png'])
+    elif args.convert_pack:
+        watcher.add(args.filenames + [args.phase_files], ['.jpg', '.rgb'])
+    else:
+        watcher.add(args.filenames, ['.bam'], ['_png.bam'])
+        watcher.add([args.phase_files], ['.jpg', '.rgb'])
+
+    return watcher
+
+def watch(args, watcher, converters, index=None, cache=None, file_index=None, profiler=None, archives=None):
+    """
+    Converts models and images again whenever they change, until interrupted.
+    The converters of the first run are kept around, so only the changed files are converted.
+        :watcher: The Watcher, created before the first run.
+        :converters: The converters of the first run, by folder.
+        :index: The TextureIndex of the first run, when rewriting models.
+    """
+    print('Watching for changes, press Ctrl+C to stop...')
+
+    try:
+        while True:
+            changed, removed = watcher.wait()
+            print(f'{len(changed)} files changed, {len(removed)} files removed.')
+
+            if file_index is not None:
+                for path in changed | removed:
+                    file_index.refresh(path)
+
+            for converter in converters.values():
+                converter.forget_files(changed | removed)
+
+            try:
+                if args.convert_to_jpg:
+                    main_jpg(args, cache, file_index, profiler, archives, converters, set(map(os.path.normcase, changed)))
+                elif args.convert_pack:
+                    main_pack(args, cache, file_index, profiler, archives, converters, set(map(os.path.normcase, changed)))
+                else:
+                    models = find_models(sorted(path for path in changed if path.lower().endswith('.bam')), file_filter=make_file_filter(args))
+                    convert_models(args, converters.get(args.phase_files), index, models, cache, profiler, archives)
+
+                archives.save()
+            except Exception:
+                # Keep on watching, the next change might fix the problem.
+                traceback.print_exc()
+
+            # Save our progress after every batch.
+            if cache is not None:
+                cache.save()
+
+            if file_index is not None:
+                file_index.save()
+    except KeyboardInterrupt:
+        print('Stopped watching.')
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='This script can be used to convert Panda3D bam models using JPG+RGB textures to use PNG textures.')
+    parser.add_argument('--jpg', '-j', action='store_true', help='Convert regular JPG textures to PNG textures.')
+    parser.add_argument('--rgb', '-r', action='store_true', help='Convert JPG+RGB texture combos to PNG textures.')
+    parser.add_argument('--overwrite', '-o', action='store_true', help='Overwrite models instead of appending _png to the filename.')
+    parser.add_argument('--convert-images', '-c', action='store_true', help='Convert all modified images to PNG in-place.')
+    parser.add_argument('--wipe-jpg', '-w', action='store_true', help='Remove all JPG+RGB files that have been converted to PNG.')
+    parser.add_argument('--early-exit', '-e', action='store_true', help='Exit immediately if an image could not be converted properly.')
+    parser.add_argument('--convert-relative', '-l', action='store_true', help='Convert all relative paths to absolute paths in models.')
+    parser.add_argument('--phase-files', '-p', help='The location of your phase files. Required for --convert-images.')
+    parser.add_argument('--convert-pack', '-b', action='store_true', help='Convert all images inside this directory.')
+    parser.add_argument('--convert-to-jpg', '-z', action='store_true', help='Convert all PNG images to JPG+RGB in-place.')
+    parser.add_argument('--jobs', '-n', type=int, default=1, help='The amount of models and images to convert in parallel. Use 0 for one job per CPU core.')
+    parser.add_argument('--cache', '-k', help='Remember converted files in this build cache file. Files that have not changed since the last run are skipped.')
+    parser.add_argument('--cache-hash', action='store_true', help='Compare file contents when the modification time of a cached file has changed.')
+    parser.add_argument('--dump-index', '-d', help='Write a JSON index of every texture, the models using it, and all unused textures in the phase files.')
+    parser.add_argument('--scan-only', '-s', action='store_true', help='Only scan models, without writing models or converting images. Useful together with --dump-index.')
+    parser.add_argument('--fast-rewrite', '-f', action='store_true', help='Only decode texture objects, copying everything else as-is. With only --rgb, models without any RGB paths are skipped without being parsed.')
+    parser.add_argument('--mmap', '-m', action='store_true', help='Memory-map models instead of reading them into memory. Implies --fast-rewrite.')
+    parser.add_argument('--file-index', '-i', action='store_true', help='Scan the pack and phase files folders once, and look up all image files from memory.')
+    parser.add_argument('--ignore-case', '-u', action='store_true', help='Look up image files case-insensitively. Implies --file-index.')
+    parser.add_argument('--file-index-cache', '-I', help='Save the file index to this file, and only rescan changed folders on the next run. Implies --file-index.')
+    parser.add_argument('--resize-filter', '-R', choices=RESIZE_FILTERS, default='gaussian', help='The filter used to resize alpha textures that do not match the size of their JPG.')
+    parser.add_argument('--image-cache-mb', '-M', type=float, default=256, help='The amount of memory in MB each process may use to keep decoded images around, such as alpha textures shared by multiple JPGs and their resized copies. Use 0 to disable.')
+    parser.add_argument('--pipeline', '-t', action='store_true', help='Read, decode, process, encode and write images on separate threads, so that disk access overlaps with image processing. Uses --jobs threads for each processing stage instead of processes.')
+    parser.add_argument('--queue-size', '-Q', type=int, default=4, help='The amount of images that may wait in front of each pipeline stage. Limits the memory used by --pipeline.')
+    parser.add_argument('--png-compression', '-C', choices=list(PNG_COMPRESSION_LEVELS) + [str(level) for level in range(10)], default='default', help='The PNG compression level: fast, default, max, or a level from 0 to 9.')
+    parser.add_argument('--png-filter', '-F', choices=PNG_FILTERS, default='default', help="The PNG filter strategy. 'default' uses Panda3D's own PNG writer, the others use our own encoder.")
+    parser.add_argument('--dedup', '-D', choices=DEDUP_MODES, default='off', help="Convert images whose input files are byte-identical only once, then 'copy' or hardlink ('link') the result to the other destinations.")
+    parser.add_argument('--analyze-alpha', '-A', action='store_true', help='Write PNG files without an alpha channel, and JPG files without an RGB file, when their alpha is fully opaque. Rewritten models only load three channels of these textures.')
+    parser.add_argument('--include', action='append', default=[], metavar='PATTERN', help='Only convert models and images whose name or path matches this pattern, such as *_gui.bam. May be given more than once.')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN', help='Skip models and images whose name or path matches this pattern, such as */phase_3/*. May be given more than once.')
+    parser.add_argument('--profile', '-P', help='Write the time, bytes and pixels spent on each stage and file to this JSON file.')
+    parser.add_argument('--watch', '-W', action='store_true', help='Keep running after converting everything, and convert models and images again as soon as they change.')
+    parser.add_argument('--watch-interval', type=float, default=1.0, help='How often to check for changes in --watch mode, in seconds.')
+    parser.add_argument('--watch-debounce', type=float, default=1.0, help='How long to wait for more changes before converting them in --watch mode, in seconds.')
+    parser.add_argument('filenames', nargs='+', help='The raw input file(s) or folder(s). Accepts * as wildcard, and ** for any number of folders.')
+    return parser
+
+def get_phase_files_error(args):
+    """
+    Returns why the phase files folder can't be used with these options, or None if it's fine.
+    """
+    if (not args.convert_to_jpg) and (args.convert_images or args.wipe_jpg or args.convert_relative or args.convert_pack or args.dump_index):
+        if not args.phase_files:
+            return 'You must specify your phase files folder!'
+        if not os.path.exists(args.phase_files):
+            return 'This phase files folder does not exist!'
 
-            if basename.endswith('_png'):
-                # This is one of our converted _png BAM files
-                continue
+def make_cache(args):
+    return BuildCache(os.path.abspath(args.cache), args.cache_hash) if args.cache else None
 
-            bam = CombinerBamFile()
+def make_file_index(args):
+    if args.file_index or args.ignore_case or args.file_index_cache:
+        return FileIndex(args.ignore_case, os.path.abspath(args.file_index_cache) if args.file_index_cache else None)
 
-            with open(file, 'rb') as f:
-                print(f'Loading {file}...')
-                bam.set_filename(file)
+def make_archives(args):
+    archives = MultifileStore(args.overwrite)
 
-                try:
-                    bam.load(f)
-                except BAMException:
-                    print(f'{file} is not a BAM file, skipping...')
-                    continue
+    if args.phase_files and is_multifile(args.phase_files):
+        archives.open(args.phase_files)
+    elif args.phase_files:
+        # Textures inside the Multifiles of the phase files folder are found just like the game would find them.
+        archives.mount_folder(args.phase_files)
 
-            if args.overwrite:
-                target_filename = file
-            else:
-                target_filename = os.path.join(os.path.dirname(file), basename + '_png' + ext)
+    return archives
 
-            textures, modified = bam.switch_texture_mode(args.jpg, args.rgb, args.convert_relative, args.phase_files)
+def main():
+    setup_p3bamboo()
 
-            if args.convert_images:
-                converter.convert_textures(textures, model_path=target_filename)
+    parser = make_parser()
+    args = parser.parse_args()
 
-                if args.wipe_jpg:
-                    for texture in textures:
-                        if texture not in to_wipe:
-                            to_wipe.append(texture)
+    if args.phase_files:
+        args.phase_files = os.path.abspath(args.phase_files)
 
-            if not modified:
-                # We are overwriting the files, but we haven't changed any textures.
-                # Why bother rewriting the BAM?
-                continue
+    error = get_phase_files_error(args)
 
-            with open(target_filename, 'wb') as f:
-                print('Writing', target_filename + '...')
-                bam.write(f)
+    if error:
+        parser.print_help()
+        print(error)
+        return
 
-    if args.wipe_jpg:
-        converter.wipe_textures(args.phase_files, to_wipe)
+    cache = make_cache(args)
+    file_index = make_file_index(args)
+    profiler = Profiler(bool(args.profile))
+    archives = make_archives(args)
+
+    # Start watching before the first run, so that files changed during the first run are not missed.
+    watcher = make_watcher(args) if args.watch else None
+
+    try:
+        if args.convert_to_jpg:
+            converters = main_jpg(args, cache, file_index, profiler, archives)
+            index = None
+        elif args.convert_pack:
+            converters = main_pack(args, cache, file_index, profiler, archives)
+            index = None
+        else:
+            converters, index = main_models(args, cache, file_index, profiler, archives)
 
-    print('Done.')
+        # Every modified Multifile is written once, after everything has been converted.
+        archives.save()
+
+        if watcher is not None:
+            watch(args, watcher, converters, index, cache, file_index, profiler, archives)
+    finally:
+        archives.close()
+
+        if cache is not None:
+            # Save our progress, even if we have exited early.
+            cache.save()
+
+        if file_index is not None:
+            file_index.save()
+
+        if args.profile:
+            profiler.write(args.profile)
+
+    print_peak_memory(args)
 
 if __name__ == '__main__':
     main()
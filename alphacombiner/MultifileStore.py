@@ -0,0 +1,436 @@
+import os, threading
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+MULTIFILE_EXTENSION = '.mf'
+
+# Images are already compressed, so only the other files are compressed inside Multifiles.
+UNCOMPRESSED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def is_multifile(path):
+    return path.lower().endswith(MULTIFILE_EXTENSION) and os.path.isfile(path)
+
+def get_key(name):
+    """
+    Returns the normalized form of a subfile name, used to look it up.
+        :name: The subfile name, or a relative path.
+    """
+    return os.path.normcase(os.path.normpath(name))
+
+class MultifileStore(object):
+    """
+    Gives access to the files inside Panda3D Multifiles, as if they were extracted.
+
+    A file inside a Multifile is addressed by the path of the Multifile followed by the subfile name,
+    such as resources/phase_3.mf/phase_3/maps/texture.jpg. Multifiles can also be mounted onto a
+    folder, just like Toontown does, so that resources/phase_3/maps/texture.jpg finds the same file.
+
+    Written and removed files are kept in memory, and every modified Multifile is written anew by save().
+    """
+
+    def __init__(self, overwrite=False):
+        self.overwrite = overwrite
+        # Multifile paths, and the subfile names inside of each of them.
+        self.archives = {}
+        # Paths of mounted files, pointing to their paths inside their Multifile.
+        self.mounts = {}
+        # Folders whose Multifiles are only mounted once a file is looked up that is not on disk.
+        self.pending_folders = []
+        # Files written and removed since the Multifiles were opened, per Multifile.
+        self.writes = {}
+        self.removals = {}
+        self.multifiles = {}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes open the Multifiles themselves.
+        state = self.__dict__.copy()
+        state['multifiles'] = {}
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_multifile(self, archive):
+        multifile = self.multifiles.get(archive)
+
+        if multifile is None:
+            from panda3d.core import Filename, Multifile
+
+            multifile = Multifile()
+
+            if not multifile.open_read(Filename.from_os_specific(self.archives[archive]['path'])):
+                raise IOError(f'Could not open Multifile {archive}!')
+
+            self.multifiles[archive] = multifile
+
+        return multifile
+
+    def open(self, path):
+        """
+        Opens a Multifile, so that the files inside it can be found.
+        Returns the key of the Multifile.
+            :path: The path of the Multifile.
+        """
+        archive = os.path.normcase(os.path.abspath(path))
+
+        if archive in self.archives:
+            return archive
+
+        # Panda3D is only loaded once a Multifile is actually used, so that plain model rewrites start quickly.
+        from panda3d.core import Filename, Multifile
+
+        multifile = Multifile()
+
+        if not multifile.open_read(Filename.from_os_specific(path)):
+            raise IOError(f'Could not open Multifile {path}!')
+
+        names = {}
+
+        for name in multifile.get_subfile_names():
+            names[get_key(name)] = name
+
+        print(f'Opened Multifile {path} with {len(names)} files.')
+        self.archives[archive] = {'path': os.path.abspath(path), 'names': names}
+        self.multifiles[archive] = multifile
+        self.writes[archive] = {}
+        self.removals[archive] = set()
+        return archive
+
+    def mount(self, path, mount_point=None):
+        """
+        Opens a Multifile, and makes its files available inside a folder.
+            :path: The path of the Multifile.
+            :mount_point: The folder the files are found in. Defaults to the folder of the Multifile.
+        """
+        archive = self.open(path)
+
+        mount_point = os.path.abspath(mount_point or os.path.dirname(os.path.abspath(path)))
+        self.archives[archive]['mount_point'] = mount_point
+
+        for key, name in self.archives[archive]['names'].items():
+            self.mounts[os.path.normcase(os.path.join(mount_point, key))] = self.join(archive, name)
+
+    def mount_folder(self, folder):
+        """
+        Mounts every Multifile inside a folder onto that folder.
+        The Multifiles are only opened once they are needed, so that runs which find everything on disk never load Panda3D.
+            :folder: The folder containing the Multifiles.
+        """
+        if os.path.isdir(folder):
+            self.pending_folders.append(folder)
+
+    def mount_pending(self):
+        """
+        Mounts the Multifiles of every folder passed to mount_folder so far.
+        """
+        if not self.pending_folders:
+            return
+
+        with self.lock:
+            folders = self.pending_folders
+            self.pending_folders = []
+
+            for folder in folders:
+                for entry in sorted(os.listdir(folder)):
+                    path = os.path.join(folder, entry)
+
+                    if is_multifile(path):
+                        self.mount(path, folder)
+
+    def get_mount_path(self, path):
+        """
+        Returns the path of a file inside a mounted Multifile, as seen from its mount point.
+        Other paths are returned as they are.
+            :path: The path inside the Multifile.
+        """
+        location = self.split(path)
+
+        if location is None:
+            return path
+
+        archive, key = location
+        self.mount_pending()
+        mount_point = self.archives[archive].get('mount_point')
+
+        if not mount_point:
+            return path
+
+        return os.path.join(mount_point, os.path.normpath(self.get_name(archive, key) or key))
+
+    def join(self, archive, name):
+        return os.path.join(self.archives[archive]['path'], os.path.normpath(name))
+
+    def split(self, path):
+        """
+        Returns the Multifile key and subfile name of a path inside a Multifile,
+        or None if the path is not inside a Multifile.
+            :path: The path of the file.
+        """
+        path = os.path.abspath(path)
+        parent = path
+
+        while True:
+            parent, child = os.path.split(parent)
+
+            if not child:
+                return None
+
+            archive = os.path.normcase(os.path.join(parent, child))
+
+            if archive not in self.archives:
+                if not archive.endswith(MULTIFILE_EXTENSION) or not os.path.isfile(archive):
+                    continue
+
+                archive = self.open(os.path.join(parent, child))
+
+            return archive, get_key(os.path.relpath(path, os.path.join(parent, child)))
+
+    def contains(self, path):
+        """
+        Is this path inside a Multifile?
+            :path: The path of the file.
+        """
+        return self.split(path) is not None
+
+    def get_name(self, archive, key):
+        """
+        Returns the actual subfile name of a file, or None if it does not exist.
+            :archive: The key of the Multifile.
+            :key: The normalized subfile name.
+        """
+        if key in self.removals[archive]:
+            return None
+        if key in self.writes[archive]:
+            return self.writes[archive][key][0]
+
+        return self.archives[archive]['names'].get(key)
+
+    def find(self, path):
+        """
+        Returns the path of a file inside a Multifile, or None if it does not exist.
+            :path: Either a path inside a Multifile, or a path inside a mounted folder.
+        """
+        location = self.split(path)
+
+        if location is None:
+            self.mount_pending()
+            path = self.mounts.get(os.path.normcase(os.path.abspath(path)))
+            return self.find(path) if path else None
+
+        archive, key = location
+        name = self.get_name(archive, key)
+        return self.join(archive, name) if name else None
+
+    def read(self, path):
+        """
+        Returns the contents of a file inside a Multifile.
+            :path: The path inside the Multifile.
+        """
+        archive, key = self.split(self.find(path) or path)
+
+        with self.lock:
+            if key in self.writes[archive]:
+                return self.writes[archive][key][1]
+
+            name = self.get_name(archive, key)
+            multifile = self.get_multifile(archive)
+            index = multifile.find_subfile(name) if name else -1
+
+            if index < 0:
+                raise FileNotFoundError(f'{path} does not exist!')
+
+            return multifile.read_subfile(index)
+
+    def write(self, path, data):
+        """
+        Writes a file into a Multifile. The file is kept in memory until the Multifile is saved.
+            :path: The path inside the Multifile.
+            :data: The contents of the file.
+        """
+        archive, key = self.split(path)
+        name = self.get_name(archive, key) or os.path.relpath(os.path.abspath(path), self.archives[archive]['path']).replace(os.sep, '/')
+
+        with self.lock:
+            self.removals[archive].discard(key)
+            self.writes[archive][key] = (name, bytes(data))
+
+    def remove(self, path):
+        """
+        Removes a file from a Multifile once it is saved.
+            :path: The path inside the Multifile.
+        """
+        archive, key = self.split(path)
+
+        with self.lock:
+            self.writes[archive].pop(key, None)
+            self.removals[archive].add(key)
+
+    def iter_files(self, folder):
+        """
+        Yields every file inside a Multifile, or every mounted file inside a folder.
+            :folder: The path of a Multifile, a folder inside one, or a mounted folder.
+        """
+        location = self.split(folder)
+
+        if location is not None:
+            archive, _ = location
+            prefix = get_key(os.path.relpath(os.path.abspath(folder), self.archives[archive]['path']))
+            prefix = '' if prefix == '.' else os.path.join(prefix, '')
+
+            for key in sorted(set(self.archives[archive]['names']) | set(self.writes[archive])):
+                name = self.get_name(archive, key)
+
+                if name and key.startswith(prefix):
+                    yield self.join(archive, name)
+
+            return
+
+        self.mount_pending()
+        prefix = os.path.normcase(os.path.join(os.path.abspath(folder), ''))
+
+        for key, path in sorted(self.mounts.items()):
+            if key.startswith(prefix) and self.find(path):
+                yield path
+
+    def pop_changes(self):
+        """
+        Returns and forgets the files written and removed so far.
+        Used by worker processes to hand their changes to the parent process.
+        """
+        with self.lock:
+            changes = {archive: (self.writes[archive], self.removals[archive]) for archive in self.archives if self.writes[archive] or self.removals[archive]}
+
+            for archive in changes:
+                self.writes[archive] = {}
+                self.removals[archive] = set()
+
+        return changes
+
+    def merge(self, changes):
+        for archive, (writes, removals) in changes.items():
+            for name in removals:
+                self.writes[archive].pop(name, None)
+
+            self.removals[archive] |= removals
+            self.writes[archive].update(writes)
+
+            for name in writes:
+                self.removals[archive].discard(name)
+
+    def get_output_path(self, archive):
+        path = self.archives[archive]['path']
+
+        if self.overwrite:
+            return path
+
+        return os.path.splitext(path)[0] + '_png' + MULTIFILE_EXTENSION
+
+    def get_base_multifile(self, archive, output_path):
+        """
+        Returns the Multifile a save starts from, and whether it is our own earlier output.
+        Once a <name>_png.mf has been written, later saves add to it, so that the files written
+        by earlier saves of a --watch session or a Batch are kept.
+            :archive: The key of the Multifile.
+            :output_path: The path the Multifile is saved to.
+        """
+        from panda3d.core import Filename, Multifile
+
+        if self.archives[archive].get('saved') and os.path.isfile(output_path):
+            multifile = Multifile()
+
+            if not multifile.open_read(Filename.from_os_specific(output_path)):
+                raise IOError(f'Could not open Multifile {output_path}!')
+
+            return multifile, True
+
+        return self.get_multifile(archive), False
+
+    def save(self):
+        """
+        Writes every modified Multifile in a single pass.
+        Unchanged files are copied over from the original Multifile, or from our earlier output.
+        """
+        for archive in sorted(self.archives):
+            writes = self.writes[archive]
+            removals = self.removals[archive]
+
+            if not writes and not removals:
+                continue
+
+            from panda3d.core import Filename, Multifile
+
+            output_path = self.get_output_path(archive)
+            temp_path = output_path + '.tmp'
+            multifile, is_output = self.get_base_multifile(archive, output_path)
+            new_multifile = Multifile()
+
+            if not new_multifile.open_write(Filename.from_os_specific(temp_path)):
+                raise IOError(f'Could not write Multifile {temp_path}!')
+
+            for index in range(multifile.get_num_subfiles()):
+                name = multifile.get_subfile_name(index)
+                key = get_key(name)
+
+                if key in writes or key in removals:
+                    continue
+
+                compression = 6 if multifile.is_subfile_compressed(index) else 0
+                self.add_subfile(new_multifile, name, multifile.read_subfile(index), compression)
+
+            for name, data in writes.values():
+                compression = 0 if name.lower().endswith(UNCOMPRESSED_EXTENSIONS) else 6
+                self.add_subfile(new_multifile, name, data, compression)
+
+            new_multifile.close()
+            multifile.close()
+
+            if not is_output:
+                del self.multifiles[archive]
+
+            os.replace(temp_path, output_path)
+            print(f'Wrote Multifile {output_path} ({len(writes)} files written, {len(removals)} removed).')
+
+            if output_path == self.archives[archive]['path']:
+                # The original Multifile has been replaced, so its new files must be found from now on.
+                self.update_names(archive, writes, removals)
+            else:
+                self.archives[archive]['saved'] = True
+
+            self.writes[archive] = {}
+            self.removals[archive] = set()
+
+    def update_names(self, archive, writes, removals):
+        names = self.archives[archive]['names']
+        mount_point = self.archives[archive].get('mount_point')
+
+        for key in removals:
+            names.pop(key, None)
+
+        for key, (name, _) in writes.items():
+            names[key] = name
+
+            if mount_point:
+                self.mounts[os.path.normcase(os.path.join(mount_point, key))] = self.join(archive, name)
+
+    def add_subfile(self, multifile, name, data, compression):
+        from panda3d.core import StringStream
+
+        # The stream is only read when flushing, so flush right away instead of keeping every file in memory.
+        stream = StringStream(data)
+        multifile.add_subfile(name, stream, compression)
+        multifile.flush()
+
+    def close(self):
+        for multifile in self.multifiles.values():
+            multifile.close()
+
+        self.multifiles.clear()
@@ -0,0 +1,118 @@
+import hashlib, os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+def link_file(source, target):
+    """
+    Hardlinks a file over another file.
+    Returns False if the file system can't link these files, such as across drives.
+        :source: The existing file.
+        :target: The path of the new link.
+    """
+    temp_path = target + '.tmp'
+
+    try:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+
+        os.link(source, temp_path)
+        os.replace(temp_path, target)
+        return True
+    except OSError:
+        return False
+
+def unlink_shared(path):
+    """
+    Removes a file if it is hardlinked to other files, so that writing it does not change the others.
+        :path: The path of the file about to be written.
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError:
+        pass
+
+class OutputDedup(object):
+    """
+    Finds image conversions whose input files are byte-identical, such as the JPG+RGB pairs copied across phase folders.
+    Only the first conversion of every distinct input is decoded and encoded.
+    Its output files are then linked or copied to the destinations of the other conversions.
+    """
+
+    def __init__(self, mode='off'):
+        self.mode = mode
+        self.enabled = mode != 'off'
+        # The content hash of every input file hashed so far, by normalized path.
+        self.file_hashes = {}
+        # The first conversion of every distinct input, by content key. Duplicates are added to its copies.
+        self.jobs = {}
+        self.conversions = 0
+        self.duplicates = 0
+        self.seconds_saved = 0.0
+        self.bytes_saved = 0
+
+    def get_file_hash(self, path, read_file):
+        """
+        Returns the content hash of a file. Files are only hashed once, until they are forgotten.
+            :path: The path of the file.
+            :read_file: Returns the contents of a file, given its path.
+        """
+        key = os.path.normcase(path)
+        file_hash = self.file_hashes.get(key)
+
+        if file_hash is None:
+            file_hash = self.file_hashes[key] = hashlib.sha1(read_file(path)).hexdigest()
+
+        return file_hash
+
+    def add(self, key, job):
+        """
+        Adds a conversion. Returns True if it is a duplicate of a conversion added before.
+            :key: The content key of the conversion, made of everything its output depends on.
+            :job: The ImageJob of the conversion.
+        """
+        first_job = self.jobs.get(key)
+
+        if first_job is None:
+            self.jobs[key] = job
+            return False
+
+        first_job.copies.append(job)
+        return True
+
+    def pop_jobs(self):
+        jobs = list(self.jobs.values())
+        self.jobs = {}
+        return jobs
+
+    def add_stats(self, jobs, seconds, bytes_saved):
+        """
+        Remembers how much work the duplicates of a batch of conversions saved.
+            :jobs: The conversions that have been run.
+            :seconds: The time spent running them.
+            :bytes_saved: The size of the duplicate outputs that have been linked instead of written.
+        """
+        duplicates = sum(len(job.copies) for job in jobs)
+
+        self.conversions += len(jobs)
+        self.duplicates += duplicates
+        # Every duplicate would have taken about as long as an average conversion.
+        self.seconds_saved += seconds * duplicates / max(len(jobs), 1)
+        self.bytes_saved += bytes_saved
+
+    def forget_files(self, paths):
+        for path in paths:
+            self.file_hashes.pop(os.path.normcase(path), None)
+
+    def print_stats(self):
+        if not self.enabled or not self.conversions:
+            return
+
+        print(f'Dedup: {self.conversions} distinct images converted, {self.duplicates} duplicates reused their output, '
+              f'saving about {self.seconds_saved:.1f}s of decoding and encoding and {self.bytes_saved / (1024 * 1024):.1f} MB of disk space.')
@@ -0,0 +1,118 @@
+import queue, threading
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+# Tells a stage thread to stop.
+STOP = object()
+
+class Pipeline(object):
+    """
+    Runs items through a chain of stages, each stage having its own threads.
+    Stages are connected by bounded queues, so that a slow stage holds back the
+    stages before it instead of letting finished work pile up in memory.
+    """
+
+    def __init__(self, stages, queue_size=4):
+        """
+        Starts the threads of every stage.
+            :stages: A list of (name, function, thread count) tuples. Each function receives
+                     an item and returns the item to hand to the next stage, or None to drop it.
+            :queue_size: The maximum amount of items waiting in front of each stage.
+        """
+        self.queues = [queue.Queue(queue_size) for _ in stages]
+        self.threads = []
+        self.error = None
+        self.pending = 0
+        self.condition = threading.Condition()
+
+        for index, (name, function, thread_count) in enumerate(stages):
+            for i in range(max(thread_count, 1)):
+                thread = threading.Thread(target=self.run_stage, args=(index, function), name=f'{name}-{i}', daemon=True)
+                thread.start()
+                self.threads.append((index, thread))
+
+    def run_stage(self, index, function):
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.queues) else None
+
+        while True:
+            item = input_queue.get()
+
+            if item is STOP:
+                return
+
+            if self.error is not None:
+                # Something went wrong earlier, so just drain the remaining work.
+                item = None
+            else:
+                try:
+                    item = function(item)
+                except BaseException as e:
+                    self.set_error(e)
+                    item = None
+
+            if item is not None and output_queue is not None:
+                output_queue.put(item)
+            else:
+                self.finish_item()
+
+    def set_error(self, error):
+        with self.condition:
+            if self.error is None:
+                self.error = error
+
+    def finish_item(self):
+        with self.condition:
+            self.pending -= 1
+            self.condition.notify_all()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def put(self, item):
+        """
+        Adds an item to the first stage, waiting if the pipeline is full.
+        Raises the error of a failed stage, if any.
+            :item: The item to process.
+        """
+        self.raise_error()
+
+        with self.condition:
+            self.pending += 1
+
+        self.queues[0].put(item)
+
+    def join(self):
+        """
+        Waits until every item has gone through the pipeline.
+        Raises the error of a failed stage, if any.
+        """
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+
+        self.raise_error()
+
+    def close(self):
+        """
+        Stops every thread, once all items before them have been processed.
+        """
+        for index, stage_queue in enumerate(self.queues):
+            threads = [thread for thread_index, thread in self.threads if thread_index == index]
+
+            for thread in threads:
+                stage_queue.put(STOP)
+
+            # Items might still be on their way to the next stage.
+            for thread in threads:
+                thread.join()
+
+        self.threads.clear()
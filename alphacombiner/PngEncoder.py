@@ -0,0 +1,159 @@
+from panda3d.core import ConfigVariableInt, StringStream
+from .ImageArray import get_pixels
+import numpy as np
+import struct, threading, zlib
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color types, by number of channels: gray, gray+alpha, RGB, RGBA.
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+class PandaCompressionLevel(object):
+    """
+    Panda3D's own PNG writer reads its compression level from a single, process-wide config variable.
+    Writes using the same level may run at the same time, while writes using another level wait for them to finish.
+    The old level is restored once no more writes are running.
+    """
+
+    def __init__(self):
+        self.variable = ConfigVariableInt('png-compression-level')
+        self.condition = threading.Condition()
+        self.level = None
+        self.old_level = None
+        self.writes = 0
+
+    def acquire(self, level):
+        with self.condition:
+            while self.writes and self.level != level:
+                self.condition.wait()
+
+            if not self.writes:
+                self.old_level = self.variable.get_value()
+                self.variable.set_value(level)
+                self.level = level
+
+            self.writes += 1
+
+    def release(self):
+        with self.condition:
+            self.writes -= 1
+
+            if not self.writes:
+                self.variable.set_value(self.old_level)
+                self.level = None
+                self.condition.notify_all()
+
+panda_compression_level = PandaCompressionLevel()
+
+def encode_panda_png(image, level=6):
+    """
+    Encodes an image into a PNG file using Panda3D's own PNG writer.
+    Returns None if the image could not be encoded.
+        :image: A PNMImage.
+        :level: The zlib compression level, only used for this image.
+    """
+    stream = StringStream()
+    panda_compression_level.acquire(level)
+
+    try:
+        if not image.write(stream, 'image.png'):
+            return None
+    finally:
+        panda_compression_level.release()
+
+    return stream.data
+
+def can_encode(image):
+    """
+    Can our encoder write this image?
+    Odd bit depths are left to Panda3D.
+        :image: A PNMImage.
+    """
+    return image.get_maxval() in (255, 65535) and image.get_num_channels() in PNG_COLOR_TYPES
+
+def get_rows(image):
+    """
+    Returns the pixels of an image as a 2D byte array, in PNG order:
+    top row first, channels in RGBA order and 16-bit values in big endian.
+        :image: A PNMImage.
+    """
+    pixels = get_pixels(image)
+    pixels = np.ascontiguousarray(pixels, dtype=pixels.dtype.newbyteorder('>'))
+    return pixels.view(np.uint8).reshape(image.get_y_size(), -1)
+
+def filter_rows(rows, bpp, png_filter):
+    """
+    Applies a PNG filter to every row, and prepends the filter type byte to each of them.
+    Every filter is computed over the whole image at once.
+        :rows: The 2D byte array returned by get_rows.
+        :bpp: The amount of bytes per pixel.
+        :png_filter: One of PNG_FILTERS, except 'default'.
+    """
+    raw = rows.astype(np.int16)
+    left = np.zeros_like(raw)
+    left[:, bpp:] = raw[:, :-bpp]
+    up = np.zeros_like(raw)
+    up[1:] = raw[:-1]
+    up_left = np.zeros_like(raw)
+    up_left[1:] = left[:-1]
+
+    def paeth():
+        estimate = left + up - up_left
+        dist_left = np.abs(estimate - left)
+        dist_up = np.abs(estimate - up)
+        dist_up_left = np.abs(estimate - up_left)
+        predictor = np.where((dist_left <= dist_up) & (dist_left <= dist_up_left), left, np.where(dist_up <= dist_up_left, up, up_left))
+        return raw - predictor
+
+    filters = {
+        'none': (0, lambda: raw),
+        'sub': (1, lambda: raw - left),
+        'up': (2, lambda: raw - up),
+        'average': (3, lambda: raw - ((left + up) >> 1)),
+        'paeth': (4, paeth)
+    }
+
+    if png_filter == 'adaptive':
+        # Same heuristic as libpng: use the filter with the smallest sum of absolute (signed) differences.
+        candidates = np.stack([function() for _, function in filters.values()]).astype(np.uint8)
+        scores = np.abs(candidates.view(np.int8).astype(np.int32)).sum(axis=2)
+        best = np.argmin(scores, axis=0)
+        filtered = candidates[best, np.arange(len(rows))]
+        filter_types = best.astype(np.uint8)
+    else:
+        filter_type, function = filters[png_filter]
+        filtered = function().astype(np.uint8)
+        filter_types = np.full(len(rows), filter_type, dtype=np.uint8)
+
+    return np.hstack([filter_types[:, None], filtered])
+
+def make_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def encode_png(image, level=6, png_filter='adaptive'):
+    """
+    Encodes an image into a PNG file.
+        :image: A PNMImage with 8 or 16 bits per channel.
+        :level: The zlib compression level.
+        :png_filter: One of PNG_FILTERS, except 'default'.
+    """
+    num_channels = image.get_num_channels()
+    bit_depth = 8 if image.get_maxval() == 255 else 16
+    rows = get_rows(image)
+    filtered = filter_rows(rows, num_channels * bit_depth // 8, png_filter)
+
+    # Filtered data compresses best when zlib favors Huffman coding over string matching.
+    strategy = zlib.Z_DEFAULT_STRATEGY if png_filter == 'none' else zlib.Z_FILTERED
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+    data = compressor.compress(filtered.tobytes()) + compressor.flush()
+
+    header = struct.pack('>IIBBBBB', image.get_x_size(), image.get_y_size(), bit_depth, PNG_COLOR_TYPES[num_channels], 0, 0, 0)
+    return PNG_SIGNATURE + make_chunk(b'IHDR', header) + make_chunk(b'IDAT', data) + make_chunk(b'IEND', b'')
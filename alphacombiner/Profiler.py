@@ -0,0 +1,137 @@
+import json, os, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+class NullStage(object):
+    """
+    Used when profiling is disabled, so that instrumented code costs next to nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def add_read(self, path):
+        pass
+
+    def add_written(self, path):
+        pass
+
+    def add_read_size(self, size):
+        pass
+
+    def add_written_size(self, size):
+        pass
+
+    def add_pixels(self, image):
+        pass
+
+NULL_STAGE = NullStage()
+
+class ProfileStage(object):
+
+    def __init__(self, profiler, name, filename):
+        self.profiler = profiler
+        self.name = name
+        self.filename = filename
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.pixels = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.records.append([
+            self.name, self.filename, time.perf_counter() - self.start,
+            self.bytes_read, self.bytes_written, self.pixels
+        ])
+
+    def add_read(self, path):
+        if os.path.exists(path):
+            self.bytes_read += os.path.getsize(path)
+
+    def add_written(self, path):
+        if os.path.exists(path):
+            self.bytes_written += os.path.getsize(path)
+
+    def add_read_size(self, size):
+        # For data that does not come straight from a file on disk.
+        self.bytes_read += size
+
+    def add_written_size(self, size):
+        # For data that is kept in memory instead of being written to a file.
+        self.bytes_written += size
+
+    def add_pixels(self, image):
+        self.pixels += image.get_x_size() * image.get_y_size()
+
+class Profiler(object):
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+
+    def stage(self, name, filename=None):
+        """
+        Returns a context manager timing a single stage of the conversion.
+            :name: The name of the stage, such as 'bam_load' or 'encode_png'.
+            :filename: The file being processed, if any.
+        """
+        if not self.enabled:
+            return NULL_STAGE
+
+        return ProfileStage(self, name, filename)
+
+    def pop_records(self):
+        records = self.records
+        self.records = []
+        return records
+
+    def merge(self, records):
+        self.records.extend(records)
+
+    def summary(self, slowest=20):
+        """
+        Returns the per-stage totals, the slowest files, and the size and encode time of every encoded image.
+            :slowest: The amount of slow files to list.
+        """
+        stages = {}
+        files = {}
+        encoded_files = []
+
+        for name, filename, seconds, bytes_read, bytes_written, pixels in self.records:
+            stage = stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'bytes_read': 0, 'bytes_written': 0, 'pixels': 0})
+            stage['count'] += 1
+            stage['seconds'] += seconds
+            stage['bytes_read'] += bytes_read
+            stage['bytes_written'] += bytes_written
+            stage['pixels'] += pixels
+
+            if filename:
+                file = files.setdefault(filename, {'filename': filename, 'seconds': 0.0, 'stages': {}})
+                file['seconds'] += seconds
+                file['stages'][name] = file['stages'].get(name, 0.0) + seconds
+
+            if filename and name.startswith('encode_'):
+                encoded_files.append({'filename': filename, 'seconds': seconds, 'bytes': bytes_written, 'pixels': pixels})
+
+        return {
+            'stages': stages,
+            'slowest_files': sorted(files.values(), key=lambda file: file['seconds'], reverse=True)[:slowest],
+            'encoded_files': sorted(encoded_files, key=lambda file: file['filename'])
+        }
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+        print(f'Wrote profile to {filename}.')
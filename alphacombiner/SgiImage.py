@@ -0,0 +1,258 @@
+import numpy as np
+import struct
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+SGI_MAGIC = 474
+HEADER = struct.Struct('>HBBHHHHII4x80sI404x')
+
+# Storage types: plain channel planes, or run-length encoded rows.
+VERBATIM = 0
+RLE = 1
+
+# The longest run a single RLE packet can hold.
+MAX_RUN = 127
+
+def decode_rle_row(data, offset, end, bpc):
+    """
+    Decodes a single run-length encoded row.
+        :data: The contents of the SGI file.
+        :offset: The offset of the row.
+        :end: The offset at which the row must end.
+        :bpc: The amount of bytes per channel.
+    """
+    row = bytearray()
+
+    while offset < end:
+        # Even 16-bit packets keep their count in the low byte.
+        count = data[offset + bpc - 1]
+        offset += bpc
+
+        if not count & MAX_RUN:
+            break
+
+        if count & 0x80:
+            size = (count & MAX_RUN) * bpc
+            row += data[offset:offset + size]
+            offset += size
+        else:
+            row += data[offset:offset + bpc] * count
+            offset += bpc
+
+    return row
+
+def read_sgi(data):
+    """
+    Decodes an SGI image, such as a Toontown RGB file.
+    Returns its pixels as a 3D array of rows, columns and channels: top row first, 8 or 16 bits per channel.
+    Raises ValueError if the image is broken, or is not an SGI image we can read.
+        :data: The contents of the SGI file.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError('SGI image is too short.')
+
+    magic, storage, bpc, dimension, x_size, y_size, z_size, _, _, _, colormap = HEADER.unpack_from(data)
+
+    if magic != SGI_MAGIC:
+        raise ValueError('Not an SGI image.')
+    if storage not in (VERBATIM, RLE) or bpc not in (1, 2) or colormap != 0:
+        raise ValueError(f'Unsupported SGI image (storage {storage}, {bpc} bytes per channel, colormap {colormap}).')
+
+    # Lower dimensions leave the sizes they don't use undefined.
+    if dimension < 2:
+        y_size = 1
+    if dimension < 3:
+        z_size = 1
+
+    if not 1 <= z_size <= 4:
+        raise ValueError(f'Unsupported SGI image with {z_size} channels.')
+
+    dtype = np.dtype('>u1' if bpc == 1 else '>u2')
+    num_rows = y_size * z_size
+
+    if storage == VERBATIM:
+        planes = np.frombuffer(data, dtype, x_size * num_rows, HEADER.size)
+    else:
+        starts = np.frombuffer(data, '>u4', num_rows, HEADER.size).tolist()
+        lengths = np.frombuffer(data, '>u4', num_rows, HEADER.size + num_rows * 4).tolist()
+        row_size = x_size * bpc
+        rows = {}
+        planes = bytearray()
+
+        for start, length in zip(starts, lengths):
+            # Identical rows are often stored only once.
+            row = rows.get((start, length))
+
+            if row is None:
+                row = rows[start, length] = decode_rle_row(data, start, min(start + length, len(data)), bpc)
+
+                if len(row) < row_size:
+                    raise ValueError('SGI image has a broken RLE row.')
+
+            planes += row[:row_size]
+
+        planes = np.frombuffer(planes, dtype)
+
+    # SGI images are stored one channel plane at a time, bottom row first.
+    pixels = planes.reshape(z_size, y_size, x_size).transpose(1, 2, 0)[::-1]
+    return np.ascontiguousarray(pixels, dtype=dtype.newbyteorder('='))
+
+def get_packets(plane):
+    """
+    Splits every row of a channel plane into RLE packets, the same way as the SGI writers of Panda3D and netpbm do:
+    runs of three or more identical pixels are repeated, and the pixels in between are copied as they are,
+    unless they start with two identical pixels.
+    Returns the position, pixel count and literal flag of every packet, ordered by position in the flattened plane.
+        :plane: A 2D array holding a single channel.
+    """
+    y_size, x_size = plane.shape
+    values = plane.ravel()
+    size = values.size
+
+    # Runs of identical pixels, which never cross rows.
+    is_start = np.ones(size, dtype=bool)
+    is_start[1:] = values[1:] != values[:-1]
+    is_start[::x_size] = True
+    run_starts = np.flatnonzero(is_start)
+    run_lengths = np.diff(np.append(run_starts, size))
+
+    # Long runs are repeated in packets of up to MAX_RUN pixels.
+    # A single pixel left over at the end of a long run is copied along with the pixels after it.
+    long_runs = run_lengths >= 3
+    long_starts = run_starts[long_runs]
+    long_lengths = run_lengths[long_runs]
+    covered = long_lengths - (long_lengths % MAX_RUN == 1)
+    num_packets = -(-covered // MAX_RUN)
+    run = np.repeat(np.arange(len(long_starts)), num_packets)
+    offset = (np.arange(len(run)) - np.repeat(np.cumsum(num_packets) - num_packets, num_packets)) * MAX_RUN
+    repeat_positions = long_starts[run] + offset
+    repeat_counts = np.minimum(covered[run] - offset, MAX_RUN)
+
+    # Everything else is split into stretches of mixed pixels, which end at the next long run or at the end of the row.
+    depth = np.zeros(size + 1, dtype=np.int32)
+    np.add.at(depth, long_starts, 1)
+    np.add.at(depth, long_starts + covered, -1)
+    mixed = np.cumsum(depth[:-1]) == 0
+    mixed_edges = np.zeros(size + 1, dtype=bool)
+    mixed_edges[:-1] = mixed
+    row_starts = np.zeros(size, dtype=bool)
+    row_starts[::x_size] = True
+    stretch_starts = np.flatnonzero(mixed & (row_starts | ~np.concatenate([[False], mixed[:-1]])))
+    stretch_ends = np.flatnonzero(mixed & (np.append(row_starts[1:], True) | ~mixed_edges[1:])) + 1
+
+    pair_starts = np.zeros(size, dtype=bool)
+    pair_starts[run_starts[run_lengths == 2]] = True
+
+    # Most stretches fit in a single literal packet.
+    simple = (stretch_ends - stretch_starts <= MAX_RUN) & ~pair_starts[stretch_starts]
+    positions = [repeat_positions, stretch_starts[simple]]
+    counts = [repeat_counts, (stretch_ends - stretch_starts)[simple]]
+    literals = [np.zeros(len(repeat_positions), dtype=bool), np.ones(np.count_nonzero(simple), dtype=bool)]
+    extra = []
+
+    for start, end in zip(stretch_starts[~simple].tolist(), stretch_ends[~simple].tolist()):
+        i = start
+
+        while i < end:
+            if pair_starts[i]:
+                extra.append((i, 2, False))
+                i += 2
+            else:
+                count = min(end - i, MAX_RUN)
+                extra.append((i, count, True))
+                i += count
+
+    if extra:
+        extra = np.array(extra, dtype=np.int64)
+        positions.append(extra[:, 0])
+        counts.append(extra[:, 1])
+        literals.append(extra[:, 2].astype(bool))
+
+    positions = np.concatenate(positions)
+    order = np.argsort(positions, kind='stable')
+    return positions[order], np.concatenate(counts)[order], np.concatenate(literals)[order]
+
+def encode_rle_plane(plane, bpc):
+    """
+    Run-length encodes every row of a channel plane.
+    Returns the encoded rows, one after another, and the length of every row.
+        :plane: A 2D array holding a single big endian channel, bottom row first.
+        :bpc: The amount of bytes per channel.
+    """
+    y_size, x_size = plane.shape
+    size = plane.size
+    positions, counts, literals = get_packets(plane)
+
+    # Every packet is made of a count, followed by the pixels to copy or the pixel to repeat.
+    # Row ends are marked with a count of zero.
+    counts_table = np.arange(256, dtype=np.dtype('>u2')).astype(np.dtype('>u1' if bpc == 1 else '>u2')).tobytes()
+    source = np.frombuffer(plane.tobytes() + counts_table, dtype=np.uint8)
+    headers = size * bpc + (counts | (literals << 7)) * bpc
+    data_lengths = np.where(literals, counts, 1) * bpc
+    rows = positions // x_size
+
+    segment_sources = np.concatenate([headers, positions * bpc, np.full(y_size, size * bpc)])
+    segment_lengths = np.concatenate([np.full(len(positions), bpc), data_lengths, np.full(y_size, bpc)])
+    segment_keys = np.concatenate([positions * 3, positions * 3 + 1, (np.arange(y_size) + 1) * x_size * 3 - 1])
+    order = np.argsort(segment_keys, kind='stable')
+    segment_sources = segment_sources[order]
+    segment_lengths = segment_lengths[order]
+
+    segment_offsets = np.cumsum(segment_lengths) - segment_lengths
+    indexes = np.repeat(segment_sources - segment_offsets, segment_lengths) + np.arange(segment_lengths.sum())
+    row_lengths = np.bincount(rows, weights=2 * bpc + data_lengths - bpc, minlength=y_size).astype(np.int64) + bpc
+    return source[indexes].tobytes(), row_lengths.tolist()
+
+def write_sgi(pixels, rle=True):
+    """
+    Encodes an SGI image. Rows are run-length encoded by default, just like Panda3D does.
+        :pixels: A 3D uint8 or uint16 array of rows, columns and channels, top row first.
+        :rle: Should the rows be run-length encoded?
+    """
+    y_size, x_size, z_size = pixels.shape
+    bpc = 1 if pixels.dtype == np.uint8 else 2
+    maxval = 255 if bpc == 1 else 65535
+
+    # Channel planes, bottom row first, in big endian.
+    planes = np.ascontiguousarray(pixels[::-1].transpose(2, 0, 1), dtype=np.dtype('>u1' if bpc == 1 else '>u2'))
+    header = HEADER.pack(SGI_MAGIC, RLE if rle else VERBATIM, bpc, 2 if z_size == 1 else 3, x_size, y_size, z_size, 0, maxval, b'', 0)
+
+    if not rle:
+        return header + planes.tobytes()
+
+    num_rows = y_size * z_size
+    offset = HEADER.size + num_rows * 8
+    starts = [0] * num_rows
+    lengths = [0] * num_rows
+    encoded = [encode_rle_plane(plane, bpc) for plane in planes]
+    row_offsets = [np.cumsum([0] + row_lengths).tolist() for _, row_lengths in encoded]
+    rows = []
+
+    # Rows are written top row first, with the channels of each row next to each other.
+    for y in reversed(range(y_size)):
+        for z in range(z_size):
+            data, row_lengths = encoded[z]
+            starts[z * y_size + y] = offset
+            lengths[z * y_size + y] = row_lengths[y]
+            offset += row_lengths[y]
+            rows.append(data[row_offsets[z][y]:row_offsets[z][y + 1]])
+
+    return header + struct.pack(f'>{num_rows * 2}I', *starts, *lengths) + b''.join(rows)
+
+def is_panda_compatible(data):
+    """
+    Can Panda3D read this SGI image correctly?
+    Panda3D reads 16-bit images without run-length encoding in the wrong byte order.
+        :data: The contents of the SGI file.
+    """
+    if len(data) < HEADER.size:
+        return True
+
+    magic, storage, bpc = struct.unpack_from('>HBB', data)
+    return magic != SGI_MAGIC or storage != VERBATIM or bpc != 2
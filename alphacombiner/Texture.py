@@ -1,5 +1,6 @@
 from p3bamboo.BamObject import BamObject
-import os
+from p3bamboo.StructDatagram import StructDatagram
+import os, struct
 
 """
   TOONTOWN ALPHA COMBINER
@@ -35,7 +36,48 @@ class Texture(BamObject):
         # We'll just read everything we need to change, and nothing else.
         self.texture_data = di.extract_bytes(di.get_remaining_size())
 
+    def read_buffer_string(self, data, offset):
+        length, = struct.unpack_from('<H', data, offset)
+        offset += 2
+        return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+    def load_buffer(self, data):
+        """
+        Loads this texture straight from a bytes-like object, such as a memoryview of a memory-mapped BAM file.
+        The texture data is kept as a slice of the buffer, so it is never copied.
+            :data: The object data, right after the object's pointer.
+        """
+        self.name, offset = self.read_buffer_string(data, 0)
+        self.filename, offset = self.read_buffer_string(data, offset)
+        self.alpha_filename, offset = self.read_buffer_string(data, offset)
+
+        if self.bam_version >= (4, 2):
+            self.primary_file_num_channels = data[offset]
+            offset += 1
+        else:
+            self.primary_file_num_channels = 0
+
+        if self.bam_version >= (4, 3):
+            self.alpha_file_channel = data[offset]
+            offset += 1
+        else:
+            self.alpha_file_channel = 0
+
+        self.texture_data = data[offset:]
+
+    def header_to_binary(self, write_version):
+        """
+        Returns everything write would write, except for the texture data.
+        """
+        dg = StructDatagram()
+        self.write_header(write_version, dg)
+        return dg.get_message()
+
     def write(self, write_version, dg):
+        self.write_header(write_version, dg)
+        dg.append_data(bytes(self.texture_data))
+
+    def write_header(self, write_version, dg):
         BamObject.write(self, write_version, dg)
 
         dg.add_string(self.name)
@@ -48,8 +90,6 @@ class Texture(BamObject):
         if write_version >= (4, 3):
             dg.add_uint8(self.alpha_file_channel)
 
-        dg.append_data(self.texture_data)
-
     def convert_path_to_absolute(self, base_folder, model_dir, filename):
         filename = os.path.abspath(os.path.join(model_dir, filename))
         filename = os.path.relpath(filename, base_folder)
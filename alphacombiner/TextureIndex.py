@@ -0,0 +1,122 @@
+from .FileDiscovery import scan_files
+import json, os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+
+def resolve_texture_path(tex_path, folder, model_path=None):
+    """
+    Turns a texture path found in a model into an OS specific path.
+        :tex_path: The texture path, relative to the model path or the model itself.
+        :folder: The folder that texture paths are relative to, such as the phase files folder.
+        :model_path: The path of the model referencing this texture, if any.
+    """
+    if not os.path.isabs(tex_path):
+        if '../' in tex_path and model_path:
+            # This texture path is using relative paths.
+            # We assume that the working directory is the model's directory
+            tex_path = os.path.join(os.path.dirname(model_path), tex_path)
+        else:
+            tex_path = os.path.join(folder, tex_path)
+
+    return os.path.normpath(tex_path.replace('\\', os.sep).replace('/', os.sep))
+
+class TextureIndex(object):
+
+    def __init__(self):
+        # Maps normalized texture paths to the models that reference them.
+        self.entries = {}
+
+    def add(self, key, texture, model_path, model_file):
+        """
+        Registers a texture referenced by a model.
+            :key: A tuple of normalized paths, as returned by ImageConverter.get_texture_key.
+            :texture: The texture transformation, as returned by switch_texture_mode.
+            :model_path: The path of the rewritten model, used to resolve relative texture paths.
+            :model_file: The path of the original model referencing this texture.
+        """
+        entry = self.entries.get(key)
+
+        if entry is None:
+            # The first model referencing this texture is used to resolve relative paths.
+            self.entries[key] = entry = {'texture': texture, 'model_path': model_path, 'models': []}
+
+        if model_file not in entry['models']:
+            # Models rewritten again by --watch are only listed once.
+            entry['models'].append(model_file)
+
+    def get_textures(self):
+        """
+        Yields every unique texture along with the model path used to resolve it.
+        """
+        for entry in self.entries.values():
+            yield entry['texture'], entry['model_path']
+
+    def find_path(self, path, converter=None):
+        """
+        Returns the actual path of a texture file, or None if it does not exist.
+            :path: The path of the texture file.
+            :converter: An optional ImageConverter, which also finds files with the file index and inside Multifiles.
+        """
+        if converter is not None:
+            return converter.find_path(path)
+
+        return path if os.path.exists(path) else None
+
+    def find_orphans(self, folder, converter=None):
+        """
+        Returns all JPG and RGB files in a folder that are not referenced by any model.
+            :folder: The folder to search, usually the phase files folder.
+            :converter: An optional ImageConverter of the folder, which also lists the files inside its Multifiles.
+        """
+        referenced = set()
+
+        for key in self.entries:
+            for path in key:
+                referenced.add(os.path.normcase(path))
+                referenced.add(os.path.normcase(self.find_path(path, converter) or path))
+
+        # The converter lists the files inside the Multifiles mounted onto the folder as well.
+        files = converter.list_files(folder) if converter is not None else scan_files(folder)
+        orphans = []
+
+        for path in files:
+            if not path.lower().endswith(('.jpg', '.rgb')):
+                continue
+
+            if os.path.normcase(path) not in referenced and os.path.normcase(self.find_path(path, converter) or path) not in referenced:
+                orphans.append(path)
+
+        return orphans
+
+    def dump(self, filename, folder=None, converter=None):
+        """
+        Writes the index to a JSON file.
+            :filename: The JSON file to write.
+            :folder: If given, JPG and RGB files in this folder that are not referenced are listed as orphans.
+            :converter: An optional ImageConverter of the folder, used to look up texture files just like it does when converting them.
+        """
+        textures = []
+
+        for key, entry in self.entries.items():
+            textures.append({
+                'files': list(key),
+                'missing': [path for path in key if self.find_path(path, converter) is None],
+                'models': entry['models']
+            })
+
+        data = {
+            'textures': textures,
+            'shared': [texture['files'] for texture in textures if len(texture['models']) > 1],
+            'orphans': self.find_orphans(folder, converter) if folder else []
+        }
+
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+
+        print(f'Wrote texture index with {len(textures)} textures to {filename}.')
@@ -0,0 +1,121 @@
+from .FileDiscovery import find_paths
+import os, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  First written for use in PANDORA
+
+  Author: Disyer
+  Date: 2020/06/13
+"""
+class Watcher(object):
+    """
+    Watches files for changes by polling their size and modification time.
+    Polling works the same on every platform and on network drives, where file system events are unreliable.
+    """
+
+    def __init__(self, interval=1.0, debounce=1.0):
+        self.interval = interval
+        self.debounce = debounce
+        # The watched paths, together with the file extensions watched and ignored inside them.
+        self.paths = []
+        # Maps every watched file to its modification time and size.
+        self.files = {}
+
+    def add(self, paths, extensions, ignored=()):
+        """
+        Starts watching files and folders. Folders are watched recursively.
+            :paths: A list of file or folder paths. Accepts *, ? and [] as wildcards, and ** for any number of folders.
+            :extensions: Only files with one of these extensions are watched.
+            :ignored: Files ending with one of these suffixes are not watched, such as our own output files.
+        """
+        paths = [path for path in paths if path]
+        extensions = tuple(extension.lower() for extension in extensions)
+        ignored = tuple(suffix.lower() for suffix in ignored)
+        self.paths.append((paths, extensions, ignored))
+        self.files.update(self.scan_paths(paths, extensions, ignored))
+
+    def is_watched(self, name, extensions, ignored):
+        name = name.lower()
+        return name.endswith(extensions) and not (ignored and name.endswith(ignored))
+
+    def scan_dir(self, path, extensions, ignored, files):
+        try:
+            it = os.scandir(path)
+        except OSError:
+            # The folder has been removed while we were scanning.
+            return
+
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    self.scan_dir(entry.path, extensions, ignored, files)
+                    continue
+
+                if not self.is_watched(entry.name, extensions, ignored):
+                    continue
+
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+    def scan_paths(self, paths, extensions, ignored):
+        files = {}
+
+        for pattern in paths:
+            for path in find_paths(pattern, folders=True):
+                path = os.path.abspath(path)
+
+                if os.path.isdir(path):
+                    self.scan_dir(path, extensions, ignored, files)
+                    continue
+
+                if not self.is_watched(path, extensions, ignored):
+                    continue
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+
+        return files
+
+    def poll(self):
+        """
+        Returns the files that have been added or modified, and the files that have been removed since the last poll.
+        """
+        files = {}
+
+        for paths, extensions, ignored in self.paths:
+            files.update(self.scan_paths(paths, extensions, ignored))
+
+        changed = set(path for path, stamp in files.items() if self.files.get(path) != stamp)
+        removed = set(self.files) - set(files)
+        self.files = files
+        return changed, removed
+
+    def wait(self):
+        """
+        Waits until files have changed, and until no more changes have come in for the debounce time.
+        A burst of writes, such as a folder of textures being copied over, ends up in a single batch.
+        Returns the added or modified files, and the removed files.
+        """
+        changed = set()
+        removed = set()
+        last_change = None
+
+        while True:
+            time.sleep(self.interval if last_change is None else min(self.interval, self.debounce))
+            new_changed, new_removed = self.poll()
+
+            if new_changed or new_removed:
+                changed = (changed - new_removed) | new_changed
+                removed = (removed - new_changed) | new_removed
+                last_change = time.monotonic()
+            elif last_change is not None and time.monotonic() - last_change >= self.debounce:
+                return changed, removed
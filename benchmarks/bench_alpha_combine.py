@@ -0,0 +1,84 @@
+from panda3d.core import PNMImage
+from alphacombiner.ImageConverter import ImageConverter
+import argparse, random, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  Alpha combine benchmark
+
+  Compares the old per-pixel alpha merge loop and PNMImage's copy_channel
+  with the whole channel copy used by ImageConverter.
+"""
+
+def make_image(size, num_channels):
+    img = PNMImage(size, size, num_channels)
+    rng = random.Random(size * num_channels)
+
+    # Filling every pixel is slow, so we only randomize a handful of rows.
+    for j in range(0, size, max(1, size // 16)):
+        for i in range(size):
+            for channel in range(num_channels):
+                img.set_channel_val(i, j, channel, rng.randint(0, 255))
+
+    return img
+
+def make_output(img):
+    output_img = PNMImage(img.get_x_size(), img.get_y_size(), 4)
+    output_img.alpha_fill(1)
+    output_img.copy_sub_image(img, 0, 0, 0, 0, img.get_x_size(), img.get_y_size())
+    return output_img
+
+def combine_per_pixel(img, alpha_img):
+    output_img = make_output(img)
+
+    for i in range(img.get_x_size()):
+        for j in range(img.get_y_size()):
+            output_img.set_alpha(i, j, alpha_img.get_gray(i, j))
+
+    return output_img
+
+def combine_copy_channel(img, alpha_img):
+    output_img = make_output(img)
+    output_img.copy_channel(alpha_img, 2, 3)
+    return output_img
+
+def combine_bulk(converter, img, alpha_img):
+    return converter.copy_gray_to_alpha(make_output(img), alpha_img)
+
+def images_equal(first, second):
+    return first.get_num_channels() == second.get_num_channels() and all(
+        first.get_channel_val(i, j, channel) == second.get_channel_val(i, j, channel)
+        for i in range(first.get_x_size())
+        for j in range(first.get_y_size())
+        for channel in range(first.get_num_channels())
+    )
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the per-pixel, copy_channel and whole channel alpha combine paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024], help='Square image sizes to test.')
+    parser.add_argument('--skip-verify', action='store_true', help='Do not compare the outputs pixel by pixel.')
+    args = parser.parse_args()
+
+    converter = ImageConverter(None)
+
+    for size in args.sizes:
+        img = make_image(size, 3)
+        alpha_img = make_image(size, 1)
+
+        old_img, old_time = time_call(combine_per_pixel, img, alpha_img)
+        channel_img, channel_time = time_call(combine_copy_channel, img, alpha_img)
+        new_img, new_time = time_call(combine_bulk, converter, img, alpha_img)
+
+        print(f'{size}x{size}: per-pixel {old_time:.4f}s, copy_channel {channel_time:.4f}s ({old_time / max(channel_time, 1e-9):.1f}x), '
+              f'bulk {new_time:.4f}s ({old_time / max(new_time, 1e-9):.1f}x)')
+
+        if not args.skip_verify and not (images_equal(old_img, channel_img) and images_equal(old_img, new_img)):
+            print(f'ERROR: Outputs differ for {size}x{size}!')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+from alphacombiner.FileDiscovery import find_paths, scan_files
+import argparse, glob, os, shutil, tempfile, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  File discovery benchmark
+
+  Compares glob and os.walk with our streaming discovery on a large tree of empty files.
+  Reports how long it takes to find the first file, which is when conversions can start, and to find every file.
+"""
+
+def write_tree(folder, files, files_per_folder, folders_per_folder):
+    """
+    Writes a tree of empty model and texture files, a few folders deep.
+    """
+    pending = [folder]
+    written = 0
+
+    while written < files:
+        path = pending.pop(0)
+        os.makedirs(path, exist_ok=True)
+
+        for i in range(min(files_per_folder, files - written)):
+            extension = ('.bam', '.jpg', '.rgb', '.png')[i % 4]
+
+            with open(os.path.join(path, f'file{i}{extension}'), 'wb'):
+                pass
+
+            written += 1
+
+        pending.extend(os.path.join(path, f'folder{i}') for i in range(folders_per_folder))
+
+def run(name, function, *args, **kwargs):
+    start = time.perf_counter()
+    first = None
+    count = 0
+
+    for _ in function(*args, **kwargs):
+        if first is None:
+            first = time.perf_counter() - start
+
+        count += 1
+
+    seconds = time.perf_counter() - start
+    print(f'{name:>20}: first file after {(first or 0) * 1000:8.1f} ms, {count} files in {seconds * 1000:8.1f} ms')
+
+def walk_files(folder):
+    for root, _, files in os.walk(folder):
+        for file in files:
+            yield os.path.join(root, file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming file discovery against glob and os.walk.')
+    parser.add_argument('--files', type=int, default=100000, help='The amount of files in the tree.')
+    parser.add_argument('--files-per-folder', type=int, default=200, help='The amount of files in each folder.')
+    parser.add_argument('--folders-per-folder', type=int, default=8, help='The amount of subfolders in each folder.')
+    parser.add_argument('--work-dir', help='Generate the tree here instead of in a temporary folder. The folder is kept afterwards.')
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='alphacombiner-discovery-')
+    tree = os.path.join(work_dir, 'tree')
+
+    try:
+        if not os.path.isdir(tree):
+            write_tree(tree, args.files, args.files_per_folder, args.folders_per_folder)
+
+        pattern = os.path.join(tree, '**', '*.bam')
+
+        # glob builds its whole list before returning anything.
+        run('glob', glob.glob, pattern, recursive=True)
+        run('iglob', glob.iglob, pattern, recursive=True)
+        run('find_paths', find_paths, pattern)
+        run('os.walk', walk_files, tree)
+        run('scan_files', scan_files, tree)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
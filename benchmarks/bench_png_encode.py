@@ -0,0 +1,56 @@
+from panda3d.core import Filename, PNMImage
+from alphacombiner.ImageOptions import PNG_COMPRESSION_LEVELS, PNG_FILTERS
+from alphacombiner.PngEncoder import encode_panda_png, encode_png
+from benchmarks.corpus import make_image
+import argparse, glob, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  PNG encode benchmark
+
+  Compares the size and encode time of every PNG
+  compression level and filter strategy.
+"""
+
+def load_images(args):
+    if not args.images:
+        return [make_image(args.size, args.size, args.channels, seed) for seed in range(args.count)]
+
+    images = []
+
+    for pattern in args.images:
+        for filename in glob.glob(pattern):
+            images.append(PNMImage(Filename.from_os_specific(filename)))
+
+    return images
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PNG compression levels and filter strategies.')
+    parser.add_argument('--count', type=int, default=8, help='The amount of synthetic images to encode.')
+    parser.add_argument('--size', type=int, default=512, help='The size of each synthetic image.')
+    parser.add_argument('--channels', type=int, default=4, choices=(1, 2, 3, 4), help='The amount of channels in each synthetic image.')
+    parser.add_argument('--levels', nargs='+', default=list(PNG_COMPRESSION_LEVELS), choices=list(PNG_COMPRESSION_LEVELS), help='The compression levels to test.')
+    parser.add_argument('images', nargs='*', help='Encode these images instead of synthetic ones. Accepts * as wildcard.')
+    args = parser.parse_args()
+
+    images = load_images(args)
+    pixels = sum(img.get_x_size() * img.get_y_size() for img in images)
+
+    print(f'{len(images)} images, {pixels / 1e6:.1f} megapixels')
+
+    for name in args.levels:
+        level = PNG_COMPRESSION_LEVELS[name]
+
+        for png_filter in PNG_FILTERS:
+            start = time.perf_counter()
+
+            if png_filter == 'default':
+                size = sum(len(encode_panda_png(img, level)) for img in images)
+            else:
+                size = sum(len(encode_png(img, level, png_filter)) for img in images)
+
+            seconds = time.perf_counter() - start
+            print(f'{name:>7} {png_filter:>8}: {size / 1024:10.1f} KB, {seconds:.3f}s ({pixels / 1e6 / max(seconds, 1e-9):.1f} MP/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+from panda3d.core import Filename, PNMImage, StringStream
+from alphacombiner.ImageArray import get_pixels, make_image as make_pixel_image
+from alphacombiner.SgiImage import read_sgi, write_sgi
+from benchmarks.corpus import make_image
+import argparse, glob, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  RGB codec benchmark
+
+  Compares the SGI codec of Panda3D with our own
+  NumPy codec, when reading and writing RGB files.
+"""
+
+def encode_panda(img):
+    stream = StringStream()
+    img.write(stream, 'bench.rgb')
+    return stream.data
+
+def decode_panda(data):
+    img = PNMImage()
+    img.read(StringStream(data), 'bench.rgb')
+    return img
+
+def load_images(args):
+    if not args.images:
+        return [make_image(args.size, args.size, args.channels, seed) for seed in range(args.count)]
+
+    images = []
+
+    for pattern in args.images:
+        for filename in glob.glob(pattern):
+            images.append(PNMImage(Filename.from_os_specific(filename)))
+
+    return images
+
+def run(name, function, items, pixels):
+    start = time.perf_counter()
+    results = [function(item) for item in items]
+    seconds = time.perf_counter() - start
+    print(f'{name:>14}: {seconds:.3f}s ({pixels / 1e6 / max(seconds, 1e-9):.1f} MP/s)')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading and writing RGB files.')
+    parser.add_argument('--count', type=int, default=8, help='The amount of synthetic images to encode.')
+    parser.add_argument('--size', type=int, default=512, help='The size of each synthetic image.')
+    parser.add_argument('--channels', type=int, default=1, choices=(1, 2, 3, 4), help='The amount of channels in each synthetic image.')
+    parser.add_argument('images', nargs='*', help='Use these images instead of synthetic ones. Accepts * as wildcard.')
+    args = parser.parse_args()
+
+    images = load_images(args)
+    pixels = sum(img.get_x_size() * img.get_y_size() for img in images)
+    arrays = [get_pixels(img) for img in images]
+
+    print(f'{len(images)} images, {pixels / 1e6:.1f} megapixels')
+
+    files = run('Panda3D write', encode_panda, images, pixels)
+    numpy_files = run('NumPy write', write_sgi, arrays, pixels)
+    run('Panda3D read', decode_panda, files, pixels)
+    run('NumPy read', lambda data: make_pixel_image(read_sgi(data)), numpy_files, pixels)
+
+    if files != numpy_files:
+        print('Warning: the two codecs wrote different RGB files!')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+from benchmarks import corpus
+import argparse, os, shutil, subprocess, sys, tempfile, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  Startup benchmark
+
+  Times whole runs of the command line tool on a single model,
+  the way a build system calls it once per model.
+  Also lists the heavy modules each run ends up importing.
+"""
+
+HEAVY_MODULES = ('panda3d.core', 'numpy')
+
+# Each run prints the heavy modules it has imported right before exiting.
+RUNNER = f'''
+import atexit, runpy, sys
+atexit.register(lambda: print('IMPORTED', *[name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+sys.argv[0] = 'alphacombiner'
+runpy.run_module('alphacombiner.Main', run_name='__main__')
+'''
+
+def run(name, arguments, runs):
+    times = []
+    imported = ''
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', RUNNER] + arguments, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=True).stdout
+        times.append(time.perf_counter() - start)
+
+    for line in output.splitlines():
+        if line.startswith('IMPORTED'):
+            imported = line[len('IMPORTED'):].strip()
+
+    times.sort()
+    print(f'{name:>16}: best {times[0] * 1000:.0f} ms, median {times[len(times) // 2] * 1000:.0f} ms, imports {imported or "nothing heavy"}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the command line tool.')
+    parser.add_argument('--runs', type=int, default=10, help='The amount of times each command is run.')
+    parser.add_argument('--work-dir', help='Generate the corpus here instead of in a temporary folder. The folder is kept afterwards.')
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='alphacombiner-startup-')
+    phase_folder = os.path.join(work_dir, 'phase')
+
+    try:
+        textures = corpus.write_textures(phase_folder, 2, 64, 64, 0.5)
+        model = corpus.write_models(phase_folder, textures, 1, 2, 1.0)[0]
+
+        run('import only', ['--help'], args.runs)
+        run('rewrite', ['--jpg', '--rgb', model], args.runs)
+        run('convert relative', ['--jpg', '--rgb', '--convert-relative', '--phase-files', phase_folder, model], args.runs)
+        run('convert images', ['--jpg', '--rgb', '--convert-images', '--phase-files', phase_folder, model], args.runs)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
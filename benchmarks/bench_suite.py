@@ -0,0 +1,143 @@
+from panda3d.core import PandaSystem
+from alphacombiner.CombinerBamFile import CombinerBamFile
+from alphacombiner.ImageConverter import ImageConverter
+from alphacombiner.Main import setup_p3bamboo
+from benchmarks import corpus
+import argparse, contextlib, io, json, os, platform, shutil, tempfile, time
+
+"""
+  TOONTOWN ALPHA COMBINER
+  Benchmark suite
+
+  Generates a synthetic corpus and times every stage of the conversion separately.
+  Results are written as JSON, so that runs can be compared by other tools.
+"""
+
+class StageTimer(object):
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+
+        # Keep the converter's progress output out of our results.
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+        self.stages.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        summary = {}
+
+        for stage, times in self.stages.items():
+            summary[stage] = {
+                'count': len(times),
+                'total': sum(times),
+                'mean': sum(times) / len(times),
+                'min': min(times),
+                'max': max(times)
+            }
+
+        return summary
+
+def bench_models(timer, models, phase_folder, fast_rewrite):
+    prefix = 'lazy_' if fast_rewrite else ''
+    textures = []
+
+    for model in models:
+        bam = CombinerBamFile()
+        bam.set_filename(model)
+
+        with timer.time(prefix + 'bam_load'), open(model, 'rb') as f:
+            if fast_rewrite:
+                bam.load_lazy(f.read())
+            else:
+                bam.load(f)
+
+        with timer.time(prefix + 'switch_texture_mode'):
+            model_textures, _ = bam.switch_texture_mode(True, True, True, phase_folder)
+
+        with timer.time(prefix + 'bam_write'):
+            if fast_rewrite:
+                bam.write_lazy(io.BytesIO())
+            else:
+                bam.write(io.BytesIO())
+
+        textures.extend(model_textures)
+
+    return textures
+
+def bench_images(timer, converter, textures, png_folder):
+    seen = set()
+
+    for texture in textures:
+        if tuple(texture) in seen:
+            continue
+
+        seen.add(tuple(texture))
+
+        with timer.time('convert_texture'):
+            converter.convert_texture(texture)
+
+    for file in sorted(os.listdir(png_folder)):
+        with timer.time('convert_png_to_jpg_rgb'):
+            converter.convert_png_to_jpg_rgb(os.path.join(png_folder, file))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every stage of the alpha combiner on a synthetic corpus.')
+    parser.add_argument('--models', type=int, default=50, help='The amount of BAM models to generate.')
+    parser.add_argument('--textures-per-model', type=int, default=4, help='The amount of Texture objects in each model.')
+    parser.add_argument('--relative-ratio', type=float, default=0.5, help='The portion of models using relative texture paths.')
+    parser.add_argument('--textures', type=int, default=20, help='The amount of JPG textures to generate.')
+    parser.add_argument('--alpha-ratio', type=float, default=0.5, help='The portion of textures with an alpha RGB file.')
+    parser.add_argument('--size', type=int, default=256, help='The size of each JPG texture.')
+    parser.add_argument('--alpha-size', type=int, help='The size of each alpha RGB file. Defaults to --size.')
+    parser.add_argument('--pngs', type=int, default=10, help='The amount of PNG textures to generate.')
+    parser.add_argument('--png-channels', type=int, default=4, choices=(1, 2, 3, 4), help='The amount of channels in each PNG texture.')
+    parser.add_argument('--work-dir', help='Generate the corpus here instead of in a temporary folder. The folder is kept afterwards.')
+    parser.add_argument('--output', '-o', help='Write the results to this JSON file instead of printing them.')
+    args = parser.parse_args()
+
+    setup_p3bamboo()
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='alphacombiner-bench-')
+    phase_folder = os.path.join(work_dir, 'phase')
+    pack_folder = os.path.join(work_dir, 'pack')
+    timer = StageTimer()
+
+    try:
+        with timer.time('generate_corpus'):
+            textures = corpus.write_textures(phase_folder, args.textures, args.size, args.alpha_size or args.size, args.alpha_ratio)
+            png_folder = corpus.write_pngs(work_dir, args.pngs, args.size, args.png_channels)
+            models = corpus.write_models(phase_folder, textures, args.models, args.textures_per_model, args.relative_ratio)
+            shutil.copytree(phase_folder, pack_folder)
+
+        bench_models(timer, models, phase_folder, fast_rewrite=False)
+        model_textures = bench_models(timer, models, phase_folder, fast_rewrite=True)
+
+        converter = ImageConverter(phase_folder)
+        bench_images(timer, converter, model_textures, png_folder)
+
+        with timer.time('convert_all'):
+            ImageConverter(pack_folder).convert_all(phase_folder)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'config': vars(args),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'panda3d': PandaSystem.get_version_string(),
+        'stages': timer.summary()
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+from panda3d.core import loadPrcFileData, CardMaker, Filename, NodePath, PNMImage, Texture
+from alphacombiner.ImageConverter import RGB_TYPE
+import os
+
+"""
+  TOONTOWN ALPHA COMBINER
+  Synthetic benchmark corpus
+
+  Generates phase folders with JPG+RGB textures, PNG textures
+  and BAM models referencing them, so that every stage can be timed
+  without needing the actual game resources.
+"""
+
+# Write texture filenames exactly as we set them, so that we control relative and absolute paths.
+loadPrcFileData('', 'bam-texture-mode unchanged')
+
+def make_image(x_size, y_size, num_channels, seed):
+    img = PNMImage(x_size, y_size, num_channels)
+    img.perlin_noise_fill(0.1, 0.1, 256, seed)
+
+    if img.has_alpha():
+        alpha = PNMImage(x_size, y_size, 1)
+        alpha.perlin_noise_fill(0.05, 0.05, 256, seed + 1)
+        img.copy_channel(alpha, 2, 3)
+
+    return img
+
+def write_textures(folder, count, size, alpha_size, alpha_ratio):
+    """
+    Writes JPG textures, with an alpha RGB file for a portion of them.
+    Returns a list of texture paths relative to the phase folder.
+    """
+    maps_folder = os.path.join(folder, 'phase_3', 'maps')
+    os.makedirs(maps_folder, exist_ok=True)
+    textures = []
+
+    for i in range(count):
+        jpg_path = f'phase_3/maps/bench_{i}.jpg'
+        make_image(size, size, 3, i).write(Filename.from_os_specific(os.path.join(folder, jpg_path)))
+
+        if i < count * alpha_ratio:
+            rgb_path = f'phase_3/maps/bench_{i}_a.rgb'
+            alpha = make_image(alpha_size, alpha_size, 1, i + count)
+            alpha.set_type(RGB_TYPE)
+            alpha.write(Filename.from_os_specific(os.path.join(folder, rgb_path)))
+            textures.append([jpg_path, rgb_path])
+        else:
+            textures.append([jpg_path])
+
+    return textures
+
+def write_pngs(folder, count, size, num_channels):
+    png_folder = os.path.join(folder, 'pngs')
+    os.makedirs(png_folder, exist_ok=True)
+
+    for i in range(count):
+        make_image(size, size, num_channels, i).write(Filename.from_os_specific(os.path.join(png_folder, f'bench_{i}.png')))
+
+    return png_folder
+
+def write_models(folder, textures, count, textures_per_model, relative_ratio):
+    """
+    Writes BAM models, each referencing a few of our textures.
+    A portion of the models uses relative (../maps) texture paths.
+    Returns the list of model paths.
+    """
+    models_folder = os.path.join(folder, 'phase_3', 'models')
+    os.makedirs(models_folder, exist_ok=True)
+    card_maker = CardMaker('card')
+    models = []
+
+    for i in range(count):
+        root = NodePath('bench')
+        relative = i < count * relative_ratio
+
+        for j in range(textures_per_model):
+            texture_files = textures[(i * textures_per_model + j) % len(textures)]
+            texture_files = ['../maps/' + os.path.basename(path) if relative else path for path in texture_files]
+
+            texture = Texture(os.path.basename(texture_files[0]))
+            texture.set_filename(texture_files[0])
+
+            if len(texture_files) > 1:
+                texture.set_alpha_filename(texture_files[1])
+
+            card = root.attach_new_node(card_maker.generate())
+            card.set_texture(texture)
+
+        model_path = os.path.join(models_folder, f'bench_{i}.bam')
+        root.write_bam_file(Filename.from_os_specific(model_path))
+        models.append(model_path)
+
+    return models
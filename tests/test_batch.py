@@ -0,0 +1,83 @@
+from alphacombiner.Batch import Batch, BatchOptions
+from benchmarks import corpus
+from tests.test_multifile_store import read_multifile, write_multifile
+import os
+
+def write_phase_multifile(tmp_path):
+    """
+    Writes a phase_3.mf with two models, each using its own JPG+RGB texture.
+    """
+    source = str(tmp_path / 'source')
+    textures = corpus.write_textures(source, 2, 32, 32, 1.0)
+    corpus.write_models(source, textures, 2, 1, 0.0)
+
+    files = {}
+
+    for root, _, names in os.walk(source):
+        for name in names:
+            path = os.path.join(root, name)
+
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, source).replace(os.sep, '/')] = f.read()
+
+    phase_files = tmp_path / 'resources'
+    phase_files.mkdir()
+    write_multifile(str(phase_files / 'phase_3.mf'), files)
+    return str(phase_files), files
+
+def test_runs_keep_each_others_multifile_outputs(tmp_path):
+    phase_files, files = write_phase_multifile(tmp_path)
+    multifile = os.path.join(phase_files, 'phase_3.mf')
+    options = BatchOptions(jpg=True, rgb=True, convert_images=True, phase_files=phase_files)
+
+    with Batch(options) as batch:
+        for i in range(2):
+            result = batch.convert_models([os.path.join(multifile, 'phase_3', 'models', f'bench_{i}.bam')])
+            assert result.ok, result.output
+
+    output = read_multifile(os.path.join(phase_files, 'phase_3_png.mf'))
+
+    for i in range(2):
+        assert f'phase_3/maps/bench_{i}.png' in output
+        assert output[f'phase_3/models/bench_{i}.bam'] != files[f'phase_3/models/bench_{i}.bam']
+        assert output[f'phase_3/maps/bench_{i}.jpg'] == files[f'phase_3/maps/bench_{i}.jpg']
+
+def write_texture_model(folder, name, texture_path):
+    """
+    Writes a model with a single texture, referenced by the given path.
+    """
+    from panda3d.core import CardMaker, Filename, NodePath, Texture
+
+    root = NodePath(name)
+    texture = Texture(name)
+    texture.set_filename(texture_path)
+    root.attach_new_node(CardMaker('card').generate()).set_texture(texture)
+
+    path = os.path.join(folder, f'{name}.bam')
+    root.write_bam_file(Filename.from_os_specific(path))
+    return path
+
+def test_fast_rewrites_match_normal_rewrites(tmp_path):
+    outputs = {}
+
+    for mode in ('normal', 'fast_rewrite', 'mmap'):
+        folder = tmp_path / mode
+        folder.mkdir()
+        models = [
+            write_texture_model(str(folder), 'tga', 'phase_3/maps/foo.tga'),
+            write_texture_model(str(folder), 'slash', '/phase_3/maps/bar.png')
+        ]
+        options = BatchOptions(jpg=True, convert_relative=True, phase_files=str(folder), **({mode: True} if mode != 'normal' else {}))
+
+        with Batch(options) as batch:
+            result = batch.convert_models(models)
+            assert result.ok, result.output
+
+        outputs[mode] = {}
+
+        for name in ('tga', 'slash'):
+            with open(folder / f'{name}_png.bam', 'rb') as f:
+                outputs[mode][name] = f.read()
+
+    assert outputs['fast_rewrite'] == outputs['normal']
+    assert outputs['mmap'] == outputs['normal']
@@ -0,0 +1,54 @@
+from alphacombiner.BuildCache import BuildCache
+import os
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def test_removed_inputs_keep_outputs_current(tmp_path):
+    jpg, rgb, png = (str(tmp_path / name) for name in ('a.jpg', 'a_a.rgb', 'a.png'))
+    write(jpg, b'jpg')
+    write(rgb, b'rgb')
+    write(png, b'png')
+
+    cache = BuildCache()
+    cache.update(f'png:{png}', [jpg, rgb], [png], {})
+    assert cache.has_outputs(f'png:{png}', {}, 2)
+
+    # Inputs removed by --wipe-jpg don't matter, but changed inputs, other options and missing outputs do.
+    os.remove(jpg)
+    assert cache.has_outputs(f'png:{png}', {}, 2)
+    assert not cache.has_outputs(f'png:{png}', {}, 1)
+    assert not cache.has_outputs(f'png:{png}', {'png_filter': 'up'}, 2)
+
+    write(rgb, b'new rgb')
+    assert not cache.has_outputs(f'png:{png}', {}, 2)
+
+    cache.update(f'png:{png}', [rgb], [png], {})
+    os.remove(png)
+    assert not cache.has_outputs(f'png:{png}', {}, 1)
+
+def test_inputs_changed_while_converting_are_not_current(tmp_path):
+    from alphacombiner.ImageConverter import ImageConverter
+    from benchmarks import corpus
+
+    folder = str(tmp_path)
+    texture = corpus.write_textures(folder, 1, 16, 16, 1.0)[0]
+    png = os.path.join(folder, 'phase_3', 'maps', 'bench_0.png')
+    converter = ImageConverter(folder, cache=BuildCache())
+    read_file = converter.read_file
+
+    def read_and_change(path, *args):
+        data = read_file(path, *args)
+
+        # Saved after we have read it, but before the conversion has finished.
+        if path.endswith('.rgb'):
+            with open(path, 'ab') as f:
+                f.write(b'\0')
+
+        return data
+
+    converter.read_file = read_and_change
+    converter.convert_texture(texture)
+    assert os.path.exists(png)
+    assert not converter.is_cached('png', png, [os.path.join(folder, path) for path in texture])
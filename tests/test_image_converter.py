@@ -0,0 +1,81 @@
+from panda3d.core import PNMImage
+from alphacombiner.ImageConverter import ImageConverter
+
+def make_image(num_channels, maxval=255):
+    image = PNMImage(8, 4, num_channels, maxval)
+
+    for x in range(8):
+        for y in range(4):
+            for channel in range(num_channels):
+                image.set_channel_val(x, y, channel, (x * 8111 + y * 3079 + channel * 1237) % (maxval + 1))
+
+    return image
+
+def get_values(image):
+    return [image.get_channel_val(x, y, channel) for x in range(8) for y in range(4) for channel in range(image.get_num_channels())]
+
+def test_gray_copied_to_alpha_like_copy_channel():
+    converter = ImageConverter(None)
+
+    for maxval in (255, 65535):
+        for alpha_channels in (1, 3):
+            image, alpha_image = make_image(4, maxval), make_image(alpha_channels, maxval)
+            expected = PNMImage(image)
+            expected.copy_channel(alpha_image, 2, 3)
+
+            assert get_values(converter.copy_gray_to_alpha(image, alpha_image)) == get_values(expected)
+
+    # An image used as its own alpha source, like the grayscale RGB files of process_png.
+    image = make_image(4)
+    expected = PNMImage(image)
+    expected.copy_channel(image, 2, 3)
+    assert get_values(converter.copy_gray_to_alpha(image, image)) == get_values(expected)
+
+def test_combined_alpha_matches_the_per_pixel_loop():
+    converter = ImageConverter(None)
+
+    for maxval in (255, 65535):
+        for alpha_maxval in (255, 65535):
+            for alpha_channels in (1, 3):
+                image, alpha_image = make_image(4, maxval), make_image(alpha_channels, alpha_maxval)
+
+                # How process_png used to combine textures, always writing 8-bit images.
+                expected = PNMImage(8, 4, 4)
+                expected.alpha_fill(1)
+                expected.copy_sub_image(image, 0, 0, 0, 0, 8, 4)
+
+                for x in range(8):
+                    for y in range(4):
+                        expected.set_alpha(x, y, alpha_image.get_gray(x, y))
+
+                output = converter.copy_gray_to_alpha(image, alpha_image, maxval=255)
+                assert output.get_maxval() == 255
+                assert get_values(output) == get_values(expected)
+
+def test_resized_alphas_are_kept_in_the_image_cache(tmp_path):
+    # Room for a single resized 4x2 alpha texture.
+    converter = ImageConverter(None, image_cache_mb=4 * 2 * 6 / (1024 * 1024))
+    alpha_path = str(tmp_path / 'a.rgb')
+    alpha_image = make_image(1)
+
+    resized = converter.resize_alpha(alpha_path, alpha_image, 4, 2)
+    assert converter.resize_alpha(alpha_path, alpha_image, 4, 2) is resized
+    assert converter.image_cache.size <= converter.image_cache.budget
+
+    # Other sizes are kept within the budget, evicting the least recently used ones.
+    converter.resize_alpha(alpha_path, alpha_image, 2, 2)
+    assert converter.image_cache.evictions == 1
+
+    converter.forget_files([alpha_path])
+    assert not converter.image_cache.images
+
+def test_png_compression_level_is_used_per_converter():
+    from panda3d.core import ConfigVariableInt
+
+    image = make_image(4)
+    fast, best = ImageConverter(None, png_compression=0), ImageConverter(None, png_compression=9)
+    level = ConfigVariableInt('png-compression-level').get_value()
+
+    # The converter created last used to set the level for every converter.
+    assert len(fast.encode_image('a.png', image)) > len(best.encode_image('a.png', image))
+    assert ConfigVariableInt('png-compression-level').get_value() == level
@@ -0,0 +1,71 @@
+from alphacombiner.MultifileStore import MultifileStore
+from panda3d.core import Filename, Multifile, StringStream
+import os
+
+def write_multifile(path, files):
+    multifile = Multifile()
+    assert multifile.open_write(Filename.from_os_specific(path))
+
+    for name, data in files.items():
+        # The stream is only read when flushing, so it must stay alive until then.
+        stream = StringStream(data)
+        multifile.add_subfile(name, stream, 0)
+        multifile.flush()
+
+    multifile.close()
+
+def read_multifile(path):
+    multifile = Multifile()
+    assert multifile.open_read(Filename.from_os_specific(path))
+    files = {name: multifile.read_subfile(multifile.find_subfile(name)) for name in multifile.get_subfile_names()}
+    multifile.close()
+    return files
+
+def test_saves_keep_earlier_saves(tmp_path):
+    path = str(tmp_path / 'phase_3.mf')
+    write_multifile(path, {'maps/a.jpg': b'a', 'maps/b.jpg': b'b', 'models/m.bam': b'old'})
+
+    archives = MultifileStore()
+    archives.write(os.path.join(path, 'maps', 'a.png'), b'a png')
+    archives.write(os.path.join(path, 'models', 'm.bam'), b'new')
+    archives.remove(os.path.join(path, 'maps', 'a.jpg'))
+    archives.save()
+
+    archives.write(os.path.join(path, 'maps', 'b.png'), b'b png')
+    archives.save()
+    archives.close()
+
+    assert read_multifile(str(tmp_path / 'phase_3_png.mf')) == {
+        'maps/a.png': b'a png',
+        'maps/b.jpg': b'b',
+        'maps/b.png': b'b png',
+        'models/m.bam': b'new'
+    }
+
+    # The original Multifile is left alone.
+    assert read_multifile(path) == {'maps/a.jpg': b'a', 'maps/b.jpg': b'b', 'models/m.bam': b'old'}
+
+def test_overwrite_saves_keep_earlier_saves(tmp_path):
+    path = str(tmp_path / 'phase_3.mf')
+    write_multifile(path, {'maps/a.jpg': b'a'})
+
+    archives = MultifileStore(overwrite=True)
+    archives.write(os.path.join(path, 'maps', 'a.png'), b'a png')
+    archives.save()
+    archives.remove(os.path.join(path, 'maps', 'a.jpg'))
+    archives.save()
+    archives.close()
+
+    assert read_multifile(path) == {'maps/a.png': b'a png'}
+
+def test_mounted_multifiles_open_on_first_lookup(tmp_path):
+    write_multifile(str(tmp_path / 'phase_3.mf'), {'phase_3/maps/a.jpg': b'a'})
+
+    archives = MultifileStore()
+    archives.mount_folder(str(tmp_path))
+    assert not archives.archives
+
+    found = archives.find(str(tmp_path / 'phase_3' / 'maps' / 'a.jpg'))
+    assert found == os.path.join(str(tmp_path / 'phase_3.mf'), 'phase_3', 'maps', 'a.jpg')
+    assert archives.read(found) == b'a'
+    archives.close()
@@ -0,0 +1,38 @@
+from alphacombiner.FileIndex import FileIndex
+from alphacombiner.ImageConverter import ImageConverter
+from alphacombiner.MultifileStore import MultifileStore
+from alphacombiner.TextureIndex import TextureIndex
+from tests.test_multifile_store import write_multifile
+import json, os
+
+def test_dump_finds_textures_like_the_converter(tmp_path):
+    folder = str(tmp_path)
+    maps = os.path.join(folder, 'phase_3', 'maps')
+    os.makedirs(maps)
+
+    for name in ('B.jpg', 'c.jpg'):
+        with open(os.path.join(maps, name), 'wb') as f:
+            f.write(b'jpg')
+
+    write_multifile(os.path.join(folder, 'phase_3.mf'), {'phase_3/maps/a.jpg': b'jpg', 'phase_3/maps/a_a.rgb': b'rgb', 'phase_3/maps/d.jpg': b'jpg'})
+
+    archives = MultifileStore()
+    archives.mount_folder(folder)
+    file_index = FileIndex(ignore_case=True)
+    file_index.add_folder(folder)
+    converter = ImageConverter(folder, file_index=file_index, archives=archives)
+    index = TextureIndex()
+
+    for texture in (['phase_3/maps/a.jpg', 'phase_3/maps/a_a.rgb'], ['phase_3/maps/b.jpg'], ['phase_3/maps/e.jpg']):
+        index.add(converter.get_texture_key(texture), texture, None, 'm.bam')
+
+    filename = str(tmp_path / 'index.json')
+    index.dump(filename, folder, converter)
+    archives.close()
+
+    with open(filename) as f:
+        data = json.load(f)
+
+    # Textures inside Multifiles and spelled in another case are found, just like when they are converted.
+    assert [path for texture in data['textures'] for path in texture['missing']] == [os.path.normcase(os.path.join(maps, 'e.jpg'))]
+    assert sorted(data['orphans']) == [os.path.join(folder, 'phase_3.mf', 'phase_3', 'maps', 'd.jpg'), os.path.join(maps, 'c.jpg')]